@@ -0,0 +1,32 @@
+import os
+import sys
+sys.path.append(os.curdir)
+from pelicanconf import *
+
+# The archive of old posts, mostly in Hungarian, built as a sub-site of its
+# own: it is too large to be built with the main site.
+PATH = 'archive'
+OUTPUT_PATH = 'output/archive'
+
+DEFAULT_LANG = 'hu'
+FILENAME_METADATA = r'(?P<date>\d{4}-\d{2}-\d{2})-(?P<slug>.*)'
+
+STATIC_PATHS = [
+    "images",
+]
+
+# The sub-site works wherever it is served from
+RELATIVE_URLS = True
+
+# Without responsive_images: resizing the images of the archive takes nearly
+# all of a build from an empty cache, which is every Nix build
+PLUGINS = ["typogrify_cache", "parallel_read"]
+
+# Parse the posts over all cores
+PARALLEL_READ_WORKERS = os.cpu_count()
+
+# Only re-read the posts which changed since the last build. Changes are told
+# by the content of the posts, as git checkouts and Nix builds do not keep
+# modification times.
+CACHE_PATH = 'cache/archive'
+CHECK_MODIFIED_METHOD = 'md5'
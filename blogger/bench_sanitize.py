@@ -0,0 +1,118 @@
+"""
+Benchmark filename sanitization over a synthetic Blogger export.
+
+An export of --entries entries (posts and comments) with accented titles, many
+of them repeated, is generated and streamed through the converter. The time
+spent building the filenames of the posts is measured with the character by
+character sanitization used before, and with the current one.
+
+    python bench_sanitize.py --entries 100000
+"""
+import argparse
+import os
+import random
+import string
+from tempfile import TemporaryDirectory
+import time
+import unicodedata
+from xml.sax.saxutils import escape
+
+from blogger2rst import (entry_to_post, ispost, iter_entries, post_filename,
+                         sanitize_string)
+
+WORDS = ['Megértésüket', 'köszönjük', 'Első', 'nap', 'Lausanne', 'à', 'vélo',
+         'Rocher-de-Naye', 'edzés', 'Genfi-tó', 'Château', 'd’Oex', 'fűtés',
+         'Túra', '(képek)', 'Noël', 'előtt', 'után', 'ősz', '2012']
+
+ENTRY = ('<entry><id>tag:blogger.com,1999:blog-1.post-%(n)d</id>'
+         '<published>2012-%(month)02d-%(day)02dT10:00:00.000+02:00</published>'
+         "<category scheme='http://schemas.google.com/g/2005#kind' "
+         "term='http://schemas.google.com/blogger/2008/kind#%(kind)s'/>"
+         "<title type='text'>%(title)s</title>"
+         "<content type='html'>%(content)s</content>"
+         '<author><name>dawe</name></author>%(reply)s</entry>')
+
+REPLY = ("<thr:in-reply-to ref='tag:blogger.com,1999:blog-1.post-%d' "
+         "xmlns:thr='http://purl.org/syndication/thread/1.0'/>")
+
+
+def legacy_sanitize_string(s):
+    s = ''.join((c for c in unicodedata.normalize('NFD', s) if
+                 unicodedata.category(c) != 'Mn'))
+    valid_chars = "-_.() %s%s" % (string.ascii_letters, string.digits)
+    s = ''.join(c for c in s if c in valid_chars)
+    return s.replace(' ', '-')
+
+
+def write_export(fname, entries, seed=0):
+    """
+    Write an export where one entry out of three is a post, the others are
+    comments. Titles are drawn from a small pool, so many repeat.
+    """
+    rng = random.Random(seed)
+    titles = [' '.join(rng.sample(WORDS, rng.randint(2, 6)))
+              for _ in range(entries // 20 + 1)]
+
+    with open(fname, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='UTF-8'?>"
+                "<feed xmlns='http://www.w3.org/2005/Atom'>")
+        for n in range(entries):
+            kind = 'post' if n % 3 == 0 else 'comment'
+            f.write(ENTRY % {
+                'n': n,
+                'month': n % 12 + 1,
+                'day': n % 28 + 1,
+                'kind': kind,
+                'title': escape(rng.choice(titles)),
+                'content': escape('<p>%s</p>' % ' '.join(
+                    rng.sample(WORDS, 10))),
+                'reply': REPLY % (n - n % 3) if kind == 'comment' else '',
+            })
+        f.write('</feed>')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmpdirname:
+        fname = os.path.join(tmpdirname, 'export.xml')
+        write_export(fname, args.entries)
+
+        start = time.perf_counter()
+        posts = [entry_to_post(entry) for entry in iter_entries(fname)
+                 if ispost(entry)]
+        parsing = time.perf_counter() - start
+
+    titles = [post['title'] for post in posts]
+    assert ([legacy_sanitize_string(t) for t in titles] ==
+            [sanitize_string(t) for t in titles])
+    sanitize_string.cache_clear()
+
+    start = time.perf_counter()
+    for title in titles:
+        legacy_sanitize_string(title)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for title in titles:
+        sanitize_string(title)
+    current = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for post in posts:
+        post_filename(post, 'rst')
+    filenames = time.perf_counter() - start
+
+    print('%d entries, %d posts, %d distinct titles'
+          % (args.entries, len(posts), len(set(titles))))
+    print('  streaming the export:    %8.3f s' % parsing)
+    print('  per-character sanitize:  %8.3f s' % legacy)
+    print('  translate table + cache: %8.3f s' % current)
+    print('  speedup:                 %8.1fx' % (legacy / current))
+    print('  all post filenames:      %8.3f s' % filenames)
+
+
+if __name__ == '__main__':
+    main()
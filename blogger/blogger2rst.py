@@ -1,21 +1,41 @@
-# -*- coding: utf-8 -*-
 """
 Blogger->Settings->Other->export blog
 """
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
 from subprocess import Popen, PIPE
+import argparse
 import datetime
+import functools
+import hashlib
+import html as htmllib
+import json
 import os
 import string
+import sys
+import time
 import unicodedata
 import xml.etree.ElementTree as ET
 
+# The pandoc cache is the content store shared with the site's build steps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'plugins'))
+from build_support.store import ContentStore  # noqa: E402
+
 
 # These tags identify the ATOM elements in the downloaded XML.
 atom = {}
 w3org = '{http://www.w3.org/2005/Atom}'
-for k in ['content', 'author', 'title', 'entry', 'category', 'published']:
+for k in ['content', 'author', 'title', 'entry', 'category', 'published',
+          'id', 'name']:
     atom[k] = w3org + k
 
+thr = {}
+w3thr = '{http://purl.org/syndication/thread/1.0}'
+for k in ['in-reply-to']:
+    thr[k] = w3thr + k
+
 
 def ispost(entry):
     category = entry.find(atom['category'])
@@ -32,24 +52,28 @@ def get_date(published):
     return datetime.datetime.strptime(d, '%Y-%m-%d')
 
 
-def strip_accents(s):
-    return ''.join((c for c in unicodedata.normalize('NFD', s) if
-                    unicodedata.category(c) != 'Mn'))
+VALID_FILENAME_CHARS = "-_.() %s%s" % (string.ascii_letters, string.digits)
 
-
-def valid_filename(s):
-    """
-    Convert a string to a valid filename.
-    """
-    valid_chars = "-_.() %s%s" % (string.ascii_letters, string.digits)
-    return ''.join(c for c in s if c in valid_chars)
+# Deletes all characters but the valid ones from an ASCII string, and turns
+# spaces into dashes
+FILENAME_TABLE = bytes.maketrans(b' ', b'-')
+INVALID_FILENAME_BYTES = bytes(
+    c for c in range(128) if chr(c) not in VALID_FILENAME_CHARS)
 
 
+@functools.lru_cache(maxsize=4096)
 def sanitize_string(s):
-    s = strip_accents(s)
-    s = valid_filename(s)
-    s = s.replace(' ', '-')
-    return s
+    """
+    Strip accents, drop the characters not allowed in filenames and turn
+    spaces into dashes.
+
+    All valid characters are ASCII, and decomposing the string separates
+    accents from their letter, so dropping everything else after the
+    decomposition strips accents as well. The whole string is processed by
+    `bytes.translate` at once, instead of character by character.
+    """
+    s = unicodedata.normalize('NFD', s).encode('ascii', 'ignore')
+    return s.translate(FILENAME_TABLE, INVALID_FILENAME_BYTES).decode('ascii')
 
 
 def entry_to_post(entry):
@@ -61,14 +85,126 @@ def entry_to_post(entry):
     tags = [c.attrib['term'] for c in entry.findall(atom['category'])
                              if not c.attrib['term'].endswith('post')]
 
-    d['title'] = unicode(title.text)
-    d['content'] = unicode(content.text)
+    d['id'] = entry.find(atom['id']).text
+    d['title'] = str(title.text)
+    d['content'] = str(content.text)
     d['published'] = get_date(published.text)
     d['tags'] = tags
 
     return d
 
 
+def entry_to_comment(entry):
+    author = entry.find(atom['author'])
+    content = entry.find(atom['content'])
+
+    return {
+        'id': entry.find(atom['id']).text,
+        'post': entry.find(thr['in-reply-to']).attrib['ref'],
+        'author': author.find(atom['name']).text,
+        'published': entry.find(atom['published']).text,
+        'content': sanitize_comment(content.text or ''),
+    }
+
+
+class CommentSanitizer(HTMLParser):
+    """
+    Keep the markup Blogger allows in comments, and escape everything else.
+
+    Comments are written by third parties, and the theme shows them as HTML,
+    so other tags, attributes and links to other schemes are dropped, and
+    tags left open are closed.
+    """
+
+    TAGS = {'a', 'b', 'br', 'em', 'i', 'p', 'strong'}
+    SCHEMES = ('http://', 'https://', 'mailto:')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.TAGS:
+            return
+        if tag == 'br':
+            self.parts.append('<br>')
+            return
+        self.open_tags.append(tag)
+        href = dict(attrs).get('href') or ''
+        if tag == 'a' and href.lower().startswith(self.SCHEMES):
+            self.parts.append('<a href="%s" rel="nofollow">'
+                              % htmllib.escape(href))
+        else:
+            self.parts.append('<%s>' % tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.open_tags:
+            return
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.parts.append('</%s>' % open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        self.parts.append(htmllib.escape(data))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.parts.append('</%s>' % self.open_tags.pop())
+
+
+def sanitize_comment(content):
+    parser = CommentSanitizer()
+    parser.feed(content)
+    parser.close()
+    return ''.join(parser.parts)
+
+
+SIDECAR_EXTENSION = '.comments.json'
+
+
+class CommentIndex:
+    """
+    Comments of the export, grouped by the post they reply to.
+
+    Comments are filed while the export is streamed, and the route of every
+    converted post is recorded, so that the comments can be written next to
+    their post once the export has been read, without a second pass.
+
+    Unlike posts, comments are therefore held in memory until the end of the
+    import: Blogger writes them after all the posts, so the comments of a post
+    are only known to be complete once the whole export is read. They are
+    short text, a small fraction of the size of the posts.
+    """
+
+    def __init__(self):
+        self.comments = defaultdict(list)
+        self.routes = {}
+
+    def add(self, comment):
+        self.comments[comment['post']].append(comment)
+
+    def sidecars(self):
+        """
+        Generate a (route, content) pair of JSON comments for every post.
+
+        The sidecar of a post is named after it, with SIDECAR_EXTENSION in
+        place of its extension. Comments of posts which were not converted
+        are skipped.
+        """
+        for post_id, comments in sorted(self.comments.items()):
+            if post_id not in self.routes:
+                continue
+            route = os.path.splitext(self.routes[post_id])[0]
+            comments = sorted(comments, key=lambda c: c['published'])
+            content = json.dumps(comments, ensure_ascii=False, indent=2,
+                                 sort_keys=True)
+            yield route + SIDECAR_EXTENSION, content + '\n'
+
+
 def post_filename(post, extension='html'):
     """
     Generate a sane filename for the post.
@@ -77,6 +213,22 @@ def post_filename(post, extension='html'):
             sanitize_string(post['title']) + '.' + extension)
 
 
+def iter_entries(source):
+    """
+    Stream the entries of a Blogger export, one at a time.
+
+    The export is parsed incrementally, and every entry is dropped from the
+    tree once the consumer asks for the next one, so memory use does not grow
+    with the size of the export.
+    """
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag == atom['entry']:
+            yield elem
+            root.clear()
+
+
 def blogger2html(xml):
     """
     Convert the XML file saved from Blogger to a set of html posts.
@@ -84,58 +236,422 @@ def blogger2html(xml):
     return process_posts(xml, html)
 
 
-def process_posts(xml, converter, **args):
-    posts = [elem for elem in xml.iter(atom['entry']) if ispost(elem)]
-    #comments = [elem for elem in xml.iter(atom['entry']) if iscomment(elem)]
-    return [converter(entry_to_post(entry), **args) for entry in posts]
+def process_posts(xml, converter, workers=1, batch_size=1, comments=None,
+                  manifest=None, **args):
+    """
+    Lazily convert the posts of an export to (route, content) pairs.
+
+    `xml` is either the filename (or file object) of the export, which is then
+    streamed, or an already parsed ElementTree.
+
+    With more than one worker, several posts are converted at the same time.
+    With a batch size above one, the posts of a batch are converted by a
+    single pandoc process (see `pandoc_batch`). Pairs are produced in the
+    order of the posts either way, and the time taken to convert each post is
+    reported on stderr.
+
+    When a `CommentIndex` is given, the comments met along the way are added
+    to it, as well as the routes of the posts. When an `ImportManifest` is
+    given, every post claims its route in it, which resolves collisions.
+    """
+    if hasattr(xml, 'iter'):
+        entries = xml.iter(atom['entry'])
+    else:
+        entries = iter_entries(xml)
+    posts = iter_posts(entries, comments)
+    batches = iter_batches(posts, batch_size)
+
+    if workers > 1:
+        converted = convert_concurrently(converter, batches, workers, args)
+    else:
+        converted = (result for batch in batches
+                     for result in convert_batch(converter, batch, args))
+    return report_conversions(converted, comments, manifest)
+
+
+def iter_posts(entries, comments=None):
+    for entry in entries:
+        if ispost(entry):
+            yield entry_to_post(entry)
+        elif comments is not None and iscomment(entry):
+            comments.add(entry_to_comment(entry))
+
+
+def iter_batches(posts, size):
+    batch = []
+    for post in posts:
+        batch.append(post)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def convert_batch(converter, batch, args):
+    """
+    Convert a batch of posts, and return their routes, contents and times.
+
+    The bodies of the posts are converted by a single pandoc process, whose
+    time is shared evenly among them.
+    """
+    write = getattr(converter, 'pandoc_format', None)
+    batched = list(batch) if write else []
+    if pandoc.cache is not None:
+        batched = [post for post in batched
+                   if not restore_body(post, write, pandoc.cache)]
+    share = 0.0
+    if len(batched) > 1:
+        start = time.time()
+        bodies = pandoc_batch([post['content'] for post in batched],
+                              write=write)
+        if bodies is not None:
+            share = (time.time() - start) / len(batched)
+            for post, body in zip(batched, bodies):
+                post['body'] = body
+                if pandoc.cache is not None:
+                    pandoc.cache.put(
+                        pandoc.cache.key(post['content'], 'html', write), body)
+
+    results = []
+    for post in batch:
+        post_id, route, content, seconds = convert_post(converter, post, args)
+        if 'body' in post:
+            seconds += share
+        results.append((post_id, route, content, seconds))
+    return results
+
+
+def convert_post(converter, post, args):
+    """
+    Convert a post, and return its id, route, content and conversion time.
+    """
+    start = time.time()
+    route, content = converter(post, **args)
+    return post['id'], route, content, time.time() - start
 
 
-def write_content(route_content, directory='.'):
+def convert_concurrently(converter, batches, workers, args):
+    """
+    Convert batches of posts over a pool of threads, each waiting on pandoc.
+
+    At most twice as many batches as workers are in flight, so posts are not
+    read from the export faster than they are converted. Results are produced
+    in the order of the posts.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(
+                executor.submit(convert_batch, converter, batch, args))
+            if len(pending) >= 2 * workers:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+
+
+def report_conversions(converted, comments=None, manifest=None):
+    for post_id, route, content, seconds in converted:
+        if manifest is not None:
+            route = manifest.claim(post_id, route)
+        print('%s (%.2f s)' % (route, seconds), file=sys.stderr)
+        if comments is not None:
+            comments.routes[post_id] = route
+        yield route, content
+
+
+def write_content(route_content, directory='.', manifest=None):
+    """
+    Write each (route, content) pair as soon as it is produced.
+
+    Files which already hold the same content are left untouched, so their
+    modification time does not change. For the posts of an `ImportManifest`,
+    this is decided from the hash recorded by the previous import, without
+    reading the file.
+    """
     for route, content in route_content:
         fname = os.path.join(directory, route)
-        if not os.path.isdir(os.path.dirname(fname)):
-            os.makedirs(os.path.dirname(fname))
-        with open(fname, 'w') as f:
-            f.write(content.encode('utf-8'))
+        data = content.encode('utf-8')
+        if manifest is not None and route in manifest.paths:
+            digest = hashlib.sha256(data).hexdigest()
+            if manifest.record(route, digest) and os.path.exists(fname):
+                continue
+        elif has_content(fname, data):
+            continue
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'wb') as f:
+            f.write(data)
+
+
+def has_content(fname, data):
+    try:
+        if os.path.getsize(fname) != len(data):
+            return False
+        with open(fname, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+MANIFEST_FILENAME = 'blogger2rst-manifest.json'
+
+
+class ImportManifest:
+    """
+    Index of the imported posts: post id -> output path -> content hash.
+
+    It is kept next to the imported content. On the next import, it detects
+    posts whose routes collide, follows posts whose route changed, and tells
+    which files did not change.
+    """
+
+    def __init__(self, posts=None):
+        self.previous = posts or {}
+        self.posts = {}
+        self.paths = {}
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            fname = os.path.join(directory, MANIFEST_FILENAME)
+            with open(fname, encoding='utf-8') as f:
+                return cls(json.load(f)['posts'])
+        except FileNotFoundError:
+            return cls()
+
+    def claim(self, post_id, route):
+        """
+        Reserve a route for the post, and return it.
+
+        When another post of this import already has the route, a number is
+        appended to it, and the collision is reported on stderr.
+        """
+        base, extension = os.path.splitext(route)
+        claimed, n = route, 1
+        while self.paths.get(claimed, post_id) != post_id:
+            n += 1
+            claimed = '%s-%d%s' % (base, n, extension)
+
+        if claimed != route:
+            print('collision: %s and %s both map to %s, '
+                  'writing the latter to %s'
+                  % (self.paths[route], post_id, route, claimed),
+                  file=sys.stderr)
+
+        self.paths[claimed] = post_id
+        self.posts[post_id] = {'path': claimed}
+        return claimed
+
+    def record(self, route, digest):
+        """
+        Record the hash of the content of a route, and tell whether the
+        previous import wrote the same content to it.
+        """
+        post_id = self.paths[route]
+        self.posts[post_id]['sha256'] = digest
+        previous = self.previous.get(post_id, {})
+        return (previous.get('path') == route
+                and previous.get('sha256') == digest)
+
+    def finish(self, directory):
+        """
+        Remove the files left behind by renamed posts.
+
+        Files which were edited since they were imported are kept. Posts
+        missing from this import keep their entry, and their files.
+        """
+        for post_id, previous in sorted(self.previous.items()):
+            current = self.posts.get(post_id)
+            if current is None:
+                if previous['path'] not in self.paths:
+                    self.posts[post_id] = previous
+                continue
+            if current['path'] == previous['path']:
+                continue
+
+            print('renamed: %s -> %s' % (previous['path'], current['path']),
+                  file=sys.stderr)
+            if previous['path'] not in self.paths:
+                remove_imported(directory, previous)
+
+    def save(self, directory):
+        content = json.dumps({'posts': self.posts}, ensure_ascii=False,
+                             indent=2, sort_keys=True)
+        write_content([(MANIFEST_FILENAME, content + '\n')], directory)
+
+
+def remove_imported(directory, entry):
+    """
+    Remove an imported post, and its comments, unless it was edited since.
+    """
+    fname = os.path.join(directory, entry['path'])
+    try:
+        with open(fname, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return
+
+    if digest != entry.get('sha256'):
+        print('keeping %s, which was edited since it was imported' % fname,
+              file=sys.stderr)
+        return
+
+    os.remove(fname)
+    sidecar = os.path.splitext(fname)[0] + SIDECAR_EXTENSION
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+
+
+class PandocCache(ContentStore):
+    """
+    Content-addressed store of pandoc output on disk.
+
+    Entries are keyed on the input and the read and write formats, so a post
+    is only converted again when its HTML changes. Entries the import did not
+    use are pruned at its end.
+    """
+
+    def key(self, s, read, write):
+        return super().key(read, write, s)
+
+
+def restore_body(post, write, cache):
+    """
+    Set the converted body of the post from the cache, if it is there.
+    """
+    body = cache.get(cache.key(post['content'], 'html', write))
+    if body is None:
+        return False
+    post['body'] = body
+    return True
 
 
 def pandoc(s, read='html', write='rst'):
     """
     Call pandoc to convert between markups.
+
+    The output is looked up in, and added to, `pandoc.cache` when it is set.
     """
+    cache = pandoc.cache
+    if cache is not None:
+        key = cache.key(s, read, write)
+        output = cache.get(key)
+        if output is not None:
+            return output
+
+    output = run_pandoc(s, read, write)
+
+    if cache is not None:
+        cache.put(key, output)
+    return output
+
+
+pandoc.cache = None
+
+
+def run_pandoc(s, read, write):
     p = Popen(['pandoc', '-r', read, '-w', write], stdin=PIPE, stdout=PIPE)
     return p.communicate(input=s.encode('utf-8'))[0].decode('utf-8')
 
 
-def markdown(post):
-    body = pandoc(post['content'], read='html', write='markdown')
+PANDOC_BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'pandoc_batch.lua')
+
+
+def pandoc_batch(sources, read='html', write='rst'):
+    """
+    Convert several documents with a single pandoc process.
+
+    The documents are passed to `PANDOC_BATCH_SCRIPT` as JSON, which reads and
+    writes each of them on its own, so that the output is the same as that of
+    one pandoc process per document: joining the documents into one would
+    change how pandoc reads them, and where it writes link references and
+    footnotes. Returns None when pandoc cannot run the script, e.g. when it is
+    older than 3.1.1, which added its JSON module.
+    """
+    p = Popen(['pandoc', 'lua', PANDOC_BATCH_SCRIPT, read, write],
+              stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    output = p.communicate(input=json.dumps(sources).encode('utf-8'))[0]
+    if p.returncode != 0:
+        return None
+    outputs = json.loads(output.decode('utf-8'))
+    if len(outputs) != len(sources):
+        return None
+    return outputs
+
+
+def post_body(post, write):
+    """
+    Convert the content of the post, unless it already was in a batch.
+    """
+    if 'body' in post:
+        return post['body']
+    return pandoc(post['content'], read='html', write=write)
+
+
+def markdown(post, split_by_date=False):
+    body = post_body(post, 'markdown')
 
     header = ''
     header += '---\n'
     header += 'title: %s\n' % post['title']
-    header += u'author: Dávid\n'
+    header += 'author: Dávid\n'
     header += 'date: %s\n' % post['published'].strftime('%Y-%m-%d')
     header += 'tags: hu\n'
     header += '---\n'
     header += '\n'
 
     content = header + body
-    return post_filename(post, 'md'), content
+    return post_route(post, 'md', split_by_date), content
+
+
+markdown.pandoc_format = 'markdown'
 
 
 def html(post):
     return post_filename(post), post['content']
 
 
-def rst(post, split_by_date=False):
-    filename = post_filename(post, 'rst')
+def post_route(post, extension, split_by_date=False):
+    filename = post_filename(post, extension)
 
     if split_by_date:
         date, filename = filename[:10], filename[11:]
         year, month, day = date.split('-')
         filename = os.path.join(year, month, day, filename)
 
-    body = pandoc(post['content'], read='html', write='rst')
+    return filename
+
+
+def pelican_html(post, split_by_date=False):
+    """
+    Write the post as an HTML article for Pelican's HTML reader.
+
+    The content of the post is already HTML, so no pandoc is needed: the
+    metadata is written as the title and meta tags of the document.
+    """
+    filename = post_route(post, 'html', split_by_date)
+
+    head = ''
+    head += '<title>%s</title>\n' % htmllib.escape(post['title'])
+    head += '<meta name="date" content="%s">\n' % (
+        post['published'].strftime('%Y-%m-%d'),)
+    if post['tags']:
+        head += '<meta name="tags" content="%s">\n' % (
+            htmllib.escape(', '.join(post['tags'])),)
+
+    content = ('<html>\n<head>\n%s</head>\n<body>\n%s\n</body>\n</html>\n'
+               % (head, post['content']))
+
+    return filename, content
+
+
+def rst(post, split_by_date=False):
+    filename = post_route(post, 'rst', split_by_date)
+
+    body = post_body(post, 'rst')
 
     header = ''
     header += '%s\n' % post['title']
@@ -144,12 +660,51 @@ def rst(post, split_by_date=False):
     header += '\n'
     content = header + body
 
-    print filename
-
     return filename, content
 
 
+rst.pandoc_format = 'rst'
+
+
+CONVERTERS = {
+    'rst': rst,
+    'markdown': markdown,
+    'html': pelican_html,
+}
+
+
 if __name__ == '__main__':
-    xml = ET.parse('blog-12-22-2012.xml')
-    content = process_posts(xml, rst, split_by_date=False)
-    write_content(content, './content/aventures')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('export', nargs='?', default='blog-12-22-2012.xml')
+    parser.add_argument('--directory', default='./content/aventures')
+    parser.add_argument('--format', choices=sorted(CONVERTERS), default='rst',
+                        help='markup of the articles; html needs no pandoc')
+    parser.add_argument('--split-by-date', action='store_true',
+                        help='write posts to year/month/day directories')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of pandoc processes run at the same time')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='number of posts converted by each pandoc process')
+    parser.add_argument('--cache', default=os.path.join('cache', 'pandoc'),
+                        help='directory where pandoc output is cached')
+    parser.add_argument('--no-cache', dest='cache', action='store_const',
+                        const=None, help='always call pandoc')
+    args = parser.parse_args()
+
+    if args.cache:
+        pandoc.cache = PandocCache(args.cache)
+
+    comments = CommentIndex()
+    manifest = ImportManifest.load(args.directory)
+    content = process_posts(args.export, CONVERTERS[args.format],
+                            workers=args.workers, batch_size=args.batch_size,
+                            comments=comments, manifest=manifest,
+                            split_by_date=args.split_by_date)
+    write_content(content, args.directory, manifest)
+    if pandoc.cache is not None and hasattr(CONVERTERS[args.format],
+                                            'pandoc_format'):
+        pruned = pandoc.cache.prune()
+        print('%d unused pandoc outputs pruned' % pruned, file=sys.stderr)
+    write_content(comments.sidecars(), args.directory)
+    manifest.finish(args.directory)
+    manifest.save(args.directory)
@@ -0,0 +1,19 @@
+-- Converts a batch of documents with a single pandoc process.
+--
+-- Usage: pandoc lua pandoc_batch.lua READ WRITE
+--
+-- Reads a JSON array of documents on stdin, and writes the JSON array of
+-- their conversions to stdout. Every document is read and written on its own,
+-- so the conversions are the same as those of `pandoc -r READ -w WRITE`.
+local read, write = arg[1], arg[2]
+
+local outputs = {}
+for i, source in ipairs(pandoc.json.decode(io.read('a'), false)) do
+  local output = pandoc.write(pandoc.read(source, read), write)
+  -- pandoc ends its output with a newline
+  if output:sub(-1) ~= '\n' then
+    output = output .. '\n'
+  end
+  outputs[i] = output
+end
+io.write(pandoc.json.encode(outputs))
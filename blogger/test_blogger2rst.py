@@ -0,0 +1,222 @@
+from collections import defaultdict
+from itertools import islice
+import os
+from shutil import which
+import sys
+from tempfile import TemporaryDirectory
+import unittest
+
+from blogger2rst import (CommentIndex, ImportManifest, PandocCache,
+                         convert_batch, entry_to_comment, entry_to_post,
+                         iscomment, ispost, iter_batches, iter_entries,
+                         markdown, pandoc, pelican_html, process_posts,
+                         report_conversions, rst, sanitize_comment,
+                         write_content)
+
+try:
+    from pelican.readers import HTMLReader
+    from pelican.settings import DEFAULT_CONFIG
+except ImportError:
+    HTMLReader = None
+else:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                    'plugins'))
+    from blogger_comments import load_comments
+
+EXPORT = os.path.join(os.path.dirname(__file__), 'blog-12-22-2012.xml')
+
+
+def first_posts(count):
+    posts = (entry_to_post(entry) for entry in iter_entries(EXPORT)
+             if ispost(entry))
+    return list(islice(posts, count))
+
+
+@unittest.skipIf(which('pandoc') is None, 'pandoc is not installed')
+class BatchConversionTest(unittest.TestCase):
+
+    def test_batched_conversion_is_identical(self):
+        posts = first_posts(60)
+        for converter in (rst, markdown):
+            expected = [converter(dict(post)) for post in posts]
+
+            batched_posts = [dict(post) for post in posts]
+            batched = [
+                (route, content)
+                for batch in iter_batches(batched_posts, 15)
+                for _, route, content, _ in convert_batch(converter, batch, {})
+            ]
+
+            self.assertEqual(batched, expected)
+            self.assertTrue(any('body' in post for post in batched_posts))
+
+    def test_batched_documents_are_converted_on_their_own(self):
+        # Headings, link references and footnotes of a post do not depend on
+        # the other posts of its batch
+        contents = [
+            '<h3>Part</h3><p>A <a href="http://a.example">link</a>.</p>',
+            'Top level<br>text',
+            '<h2>Other</h2><p>The <a href="http://b.example">link</a>.</p>',
+            '<p>Note<sup><a href="#fn1" id="r1">1</a></sup></p>'
+            '<ol class="footnotes"><li id="fn1">Text <a href="#r1">\u21a9</a>'
+            '</li></ol>',
+            '',
+        ]
+        posts = [dict(first_posts(1)[0], content=content)
+                 for content in contents]
+        for converter in (rst, markdown):
+            expected = [converter(dict(post))[1] for post in posts]
+            batched_posts = [dict(post) for post in posts]
+            batched = [content for _, _, content, _
+                       in convert_batch(converter, batched_posts, {})]
+
+            self.assertEqual(batched, expected)
+
+
+@unittest.skipIf(HTMLReader is None, 'pelican is not installed')
+class PelicanHTMLTest(unittest.TestCase):
+
+    def test_metadata_is_read_by_pelican(self):
+        posts = first_posts(10)
+        reader = HTMLReader(DEFAULT_CONFIG.copy())
+        with TemporaryDirectory() as tmpdirname:
+            write_content((pelican_html(post) for post in posts), tmpdirname)
+            for post in posts:
+                fname = os.path.join(tmpdirname, pelican_html(post)[0])
+                content, metadata = reader.read(fname)
+
+                self.assertEqual(metadata['title'], post['title'])
+                self.assertEqual(metadata['date'].date(),
+                                 post['published'].date())
+                self.assertEqual([tag.name for tag in metadata.get('tags', [])],
+                                 post['tags'])
+                self.assertTrue(content.strip())
+
+
+class Article:
+
+    def __init__(self, source_path):
+        self.source_path = source_path
+
+
+@unittest.skipIf(HTMLReader is None, 'pelican is not installed')
+class CommentsTest(unittest.TestCase):
+
+    def test_comments_are_attached_to_their_article(self):
+        expected = defaultdict(list)
+        for entry in iter_entries(EXPORT):
+            if iscomment(entry):
+                comment = entry_to_comment(entry)
+                expected[comment['post']].append(comment['id'])
+
+        with TemporaryDirectory() as tmpdirname:
+            comments = CommentIndex()
+            manifest = ImportManifest.load(tmpdirname)
+            write_content(process_posts(EXPORT, pelican_html,
+                                        comments=comments, manifest=manifest),
+                          tmpdirname, manifest)
+            write_content(comments.sidecars(), tmpdirname)
+
+            attached = 0
+            for post_id, route in comments.routes.items():
+                article = Article(os.path.join(tmpdirname, route))
+                load_comments(article)
+                ids = [c['id'] for c in getattr(article, 'comments', [])]
+                self.assertEqual(sorted(ids), sorted(expected[post_id]))
+                attached += len(ids)
+
+        self.assertTrue(attached)
+        self.assertEqual(attached, sum(
+            len(ids) for post_id, ids in expected.items()
+            if post_id in comments.routes))
+
+
+class SanitizeCommentTest(unittest.TestCase):
+
+    def test_comments_are_sanitized(self):
+        self.assertEqual(sanitize_comment('Szia<BR>:)'), 'Szia<br>:)')
+        self.assertEqual(sanitize_comment('<b>open'), '<b>open</b>')
+        self.assertEqual(
+            sanitize_comment('<script>alert(1)</script><a href="http://x">y'),
+            'alert(1)<a href="http://x" rel="nofollow">y</a>')
+        self.assertEqual(
+            sanitize_comment('<a href="javascript:alert(1)" onclick="x">y</a>'),
+            '<a>y</a>')
+
+
+class CacheTest(unittest.TestCase):
+
+    def tearDown(self):
+        pandoc.cache = None
+
+    def test_cached_output_is_used(self):
+        with TemporaryDirectory() as tmpdirname:
+            pandoc.cache = PandocCache(tmpdirname)
+            key = pandoc.cache.key('<p>Szia</p>', 'html', 'rst')
+            pandoc.cache.put(key, 'Szia\n')
+
+            # pandoc is not run for cached input, installed or not
+            self.assertEqual(pandoc('<p>Szia</p>'), 'Szia\n')
+
+    def test_unused_output_is_pruned(self):
+        with TemporaryDirectory() as tmpdirname:
+            pandoc.cache = PandocCache(tmpdirname)
+            for s, output in (('<p>Szia</p>', 'Szia\n'),
+                              ('<p>Helló</p>', 'Helló\n')):
+                pandoc.cache.put(pandoc.cache.key(s, 'html', 'rst'), output)
+            pandoc.cache.prune()
+
+            # The next import only converts the first post again
+            pandoc('<p>Szia</p>')
+            self.assertEqual(pandoc.cache.prune(), 1)
+            self.assertEqual(pandoc('<p>Szia</p>'), 'Szia\n')
+            self.assertIsNone(pandoc.cache.get(
+                pandoc.cache.key('<p>Helló</p>', 'html', 'rst')))
+
+    def test_identical_files_are_not_rewritten(self):
+        with TemporaryDirectory() as tmpdirname:
+            route_content = [('2012/post.rst', 'Árvíztűrő tükörfúrógép\n')]
+            write_content(route_content, tmpdirname)
+            fname = os.path.join(tmpdirname, '2012', 'post.rst')
+            os.utime(fname, (0, 0))
+
+            write_content(route_content, tmpdirname)
+            self.assertEqual(os.path.getmtime(fname), 0)
+
+            write_content([('2012/post.rst', 'Changed\n')], tmpdirname)
+            self.assertNotEqual(os.path.getmtime(fname), 0)
+
+
+class ManifestTest(unittest.TestCase):
+
+    def import_posts(self, directory, posts):
+        manifest = ImportManifest.load(directory)
+        converted = [(post_id, route, content, 0.0)
+                     for post_id, route, content in posts]
+        write_content(report_conversions(converted, manifest=manifest),
+                      directory, manifest)
+        manifest.finish(directory)
+        manifest.save(directory)
+        return manifest
+
+    def test_collisions_and_renames(self):
+        with TemporaryDirectory() as tmpdirname:
+            manifest = self.import_posts(tmpdirname, [
+                ('a', 'post.rst', 'A\n'),
+                ('b', 'post.rst', 'B\n'),
+            ])
+            self.assertEqual(manifest.posts['a']['path'], 'post.rst')
+            self.assertEqual(manifest.posts['b']['path'], 'post-2.rst')
+
+            manifest = self.import_posts(tmpdirname, [
+                ('a', 'renamed.rst', 'A\n'),
+                ('b', 'post.rst', 'B\n'),
+            ])
+            self.assertEqual(sorted(os.listdir(tmpdirname)), [
+                'blogger2rst-manifest.json', 'post.rst', 'renamed.rst'])
+            with open(os.path.join(tmpdirname, 'post.rst')) as f:
+                self.assertEqual(f.read(), 'B\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
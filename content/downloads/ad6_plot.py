@@ -1,36 +1,120 @@
 #!/usr/bin/env python
 """ Plot Alpe d'HuZes profile data"""
 
-from datetime import datetime
+import argparse
+
 import matplotlib.pyplot as plt
 plt.xkcd()
 
 import pandas as pd
 
 
-# Read the CSV file.  The exported file has the following columns
+# The exported file has the following columns
 # Time	HR[bpm]	Pace[min/mile]	Altitude[m]
-data = pd.read_csv('ad6.txt', sep='\t', index_col=0, parse_dates=True)
+# Time is the elapsed time (H:MM:SS) and pace is given as M:SS. The heart rate
+# is missing from the rows where the strap lost contact, hence the nullable
+# integer type.
+COLUMNS = ['time', 'hr', 'pace', 'altitude']
+DTYPES = {'time': str, 'hr': 'Int16', 'pace': str, 'altitude': 'float32'}
+
+
+def to_min_per_km(pace):
+    """Convert a column of M:SS strings to timedeltas, without parsing each
+    row with strptime."""
+    parts = pace.str.split(':', n=1, expand=True).astype('int32')
+    return pd.to_timedelta(parts[0] * 60 + parts[1], unit='s')
+
+
+def prepare(chunk, previous_altitude=None):
+    """Index a chunk of the log by elapsed time, convert the pace and compute
+    the elevation gained on each row.
+
+    ``previous_altitude`` is the last altitude of the previous chunk, so that
+    no gain is lost between chunks."""
+    chunk.index = pd.to_timedelta(chunk.pop('time'))
+    chunk['pace'] = to_min_per_km(chunk['pace'])
+
+    altitude = chunk['altitude']
+    if previous_altitude is not None:
+        gain = altitude.diff().fillna(altitude.iloc[0] - previous_altitude)
+    else:
+        gain = altitude.diff()
+    chunk['gain'] = gain.clip(lower=0) / 1000
+    return chunk
+
+
+def read_log(fname, chunksize=None, bucket=None):
+    """Read the activity log, optionally in chunks of ``chunksize`` rows and
+    downsampled to time buckets such as '5min'.
+
+    When downsampling, heart rate, pace and altitude are averaged over each
+    bucket. Chunks are reduced to sums and counts per bucket before being
+    combined, so only the downsampled data is ever held in memory, and buckets
+    spanning two chunks are still averaged correctly. Missing heart rates are
+    left out of the averages.
+
+    Raises ValueError when the log holds no samples."""
+    reader = pd.read_csv(fname, sep='\t', header=0, names=COLUMNS,
+                         dtype=DTYPES, chunksize=chunksize)
+    if chunksize is None:
+        reader = [reader]
+
+    parts = []
+    previous_altitude = None
+    for chunk in reader:
+        if chunk.empty:
+            continue
+        chunk = prepare(chunk, previous_altitude)
+        previous_altitude = chunk['altitude'].iloc[-1]
+        if bucket is not None:
+            # Buckets start at whole multiples of the bucket, rather than at
+            # the first sample of the chunk like with resample
+            grouped = chunk.groupby(chunk.index.floor(bucket))
+            chunk = grouped.sum().join(
+                grouped[['hr', 'pace', 'altitude']].count(), rsuffix='_n')
+        parts.append(chunk)
+
+    if not parts:
+        raise ValueError('%s holds no samples' % fname)
+
+    data = pd.concat(parts)
+    if bucket is not None:
+        data = data.groupby(level=0).sum()
+        for column in ('hr', 'pace', 'altitude'):
+            data[column] = data[column] / data.pop(column + '_n')
+
+    data['elevation_gain'] = data.pop('gain').cumsum()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('fname', nargs='?', default='ad6.txt')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='read the log this many rows at a time')
+    parser.add_argument('--downsample', default=None, metavar='BUCKET',
+                        help="average the samples over time buckets, "
+                        "e.g. '30s' or '5min'")
+    args = parser.parse_args()
 
+    data = read_log(args.fname, args.chunksize, args.downsample)
 
-def to_min_per_km(s):
-    return datetime.strptime(s, '%M:%S') - datetime(1900, 1, 1)
+    plt.clf()
+    plt.subplot(211)
+    plt.title("Alpe d'HuZes 2015 (ascent to Alpe d'Huez 6 times)")
+    data.plot(y='altitude', ax=plt.gca())
+    plt.ylabel('altitude [m]')
 
-data['elevation_gain'] = data['altitude'].diff().clip(0).cumsum() / 1000
-data['pace'] = data['pace'].apply(to_min_per_km)
+    plt.subplot(212)
 
-plt.clf()
-plt.subplot(211)
-plt.title("Alpe d'HuZes 2015 (ascent to Alpe d'Huez 6 times)")
-data.plot(y='altitude')
-plt.ylabel('altitude [m]')
+    data.plot(y='elevation_gain', ax=plt.gca())
+    plt.ylabel('elevation gain [km]')
 
-plt.subplot(212)
+    plt.tight_layout()
+    plt.show()
 
-data.plot(y='elevation_gain')
-plt.ylabel('elevation gain [km]')
+    plt.savefig('ad6_elevation.png')
 
-plt.tight_layout()
-plt.show()
 
-plt.savefig('ad6_elevation.png')
+if __name__ == '__main__':
+    main()
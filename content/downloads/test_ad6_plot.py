@@ -0,0 +1,59 @@
+import os
+from tempfile import TemporaryDirectory
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pandas as pd
+
+from ad6_plot import read_log
+
+
+LOG = """time	hr	pace	altitude
+0:00:00	120	7:47	600
+0:01:00		7:47	610
+0:02:00	130	8:00	605
+0:03:00	140	8:10	620
+0:04:00	150	8:20	640
+"""
+
+
+class ReadLogTest(unittest.TestCase):
+
+    def write_log(self, directory, text):
+        fname = os.path.join(directory, 'ad6.txt')
+        with open(fname, 'w') as f:
+            f.write(text)
+        return fname
+
+    def test_missing_heart_rate_is_left_out(self):
+        with TemporaryDirectory() as tmpdirname:
+            fname = self.write_log(tmpdirname, LOG)
+            data = read_log(fname)
+            self.assertEqual(str(data['hr'].dtype), 'Int16')
+            self.assertTrue(pd.isna(data['hr'].iloc[1]))
+
+            downsampled = read_log(fname, bucket='2min')
+            self.assertEqual(list(downsampled['hr']), [120, 135, 150])
+
+    def test_chunks_do_not_change_the_result(self):
+        with TemporaryDirectory() as tmpdirname:
+            fname = self.write_log(tmpdirname, LOG)
+            expected = read_log(fname, bucket='2min')
+            for chunksize in (1, 2, 3):
+                data = read_log(fname, chunksize=chunksize, bucket='2min')
+                pd.testing.assert_frame_equal(data, expected)
+            self.assertAlmostEqual(expected['elevation_gain'].iloc[-1], 0.045,
+                                   places=6)
+
+    def test_empty_log(self):
+        with TemporaryDirectory() as tmpdirname:
+            fname = self.write_log(tmpdirname, LOG.splitlines(True)[0])
+            for chunksize in (None, 2):
+                with self.assertRaises(ValueError):
+                    read_log(fname, chunksize=chunksize)
+
+
+if __name__ == '__main__':
+    unittest.main()
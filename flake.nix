@@ -19,6 +19,8 @@
           markdown
           pelican
           typogrify
+          brotli
+          pillow
         ]);
 
         buildSite = { relativeUrls ? false }: pkgs.stdenv.mkDerivation {
@@ -46,6 +48,27 @@
           '';
         };
 
+        # The archive of old posts is built as a sub-site of its own
+        buildArchive = pkgs.stdenv.mkDerivation {
+          name = "thewagner-net-archive-${self.shortRev or "dirty"}";
+
+          nativeBuildInputs = [ pythonEnv ];
+
+          src = builtins.path {
+            path = ./.;
+            name = "src";
+          };
+
+          dontBuild = true;
+
+          installPhase = ''
+            pelican \
+              --settings archiveconf.py \
+              --output $out \
+              ./archive
+          '';
+        };
+
         buildImage =
           let
             port = "8000";
@@ -82,6 +105,7 @@
 
         packages = {
           ociImage = buildImage;
+          archive = buildArchive;
           default = buildSite { };
         };
 
@@ -1,3 +1,6 @@
+import os
+import sys
+
 AUTHOR = 'David Wagner'
 SITENAME = 'The Wagner'
 
@@ -36,11 +39,22 @@ STATIC_PATHS = [
     "README",
 ]
 
+# The tests of the downloadable scripts, and what running them leaves behind,
+# stay out of the site. Patterns are matched against file and directory names.
+IGNORE_FILES = [".*", "test_*.py", "__pycache__"]
+
 THEME = "theme"
 
-PLUGIN_PATHS = ["./plugins/render-math/pelican/plugins"]
-PLUGINS = ["render_math"]
+PLUGIN_PATHS = ["./plugins", "./plugins/render-math/pelican/plugins"]
+# Helpers the plugins have in common are imported from plugins/build_support
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "plugins"))
+# typogrify_cache takes over TYPOGRIFY and must come before render_math
+PLUGINS = ["blogger_comments", "typogrify_cache", "render_math", "responsive_images"]
 
 TYPOGRIFY = True
 
+# Only re-read and re-process the content which changed since the last build
+CACHE_CONTENT = True
+LOAD_CONTENT_CACHE = True
+
 REVISION = "main"
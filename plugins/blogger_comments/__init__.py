@@ -0,0 +1,50 @@
+"""Blogger Comments: show comments imported from Blogger on their article.
+
+``blogger/blogger2rst.py`` writes the comments of every imported post to a
+``<post>.comments.json`` sidecar file next to it. This plugin loads the sidecar
+of every article which has one into ``article.comments``, so that the theme can
+render the comments statically.
+
+Sidecars are loaded once all articles are read, on every build, so that edited
+comments show up even when the article itself comes from Pelican's cache.
+"""
+
+from datetime import datetime
+import json
+import os
+
+from pelican import signals
+
+SIDECAR_EXTENSION = ".comments.json"
+
+
+def sidecar_path(source_path):
+    """Return the path of the comments sidecar of a source file."""
+    return os.path.splitext(source_path)[0] + SIDECAR_EXTENSION
+
+
+def load_comments(content):
+    """Attach the comments of the sidecar file to the content, if there is one."""
+    if not content.source_path:
+        return
+
+    try:
+        with open(sidecar_path(content.source_path), encoding="utf-8") as sidecar:
+            comments = json.load(sidecar)
+    except FileNotFoundError:
+        return
+
+    for comment in comments:
+        comment["date"] = datetime.fromisoformat(comment["published"])
+    content.comments = comments
+
+
+def load_all_comments(generator):
+    """Attach the comments of every article of the generator."""
+    for article in generator.articles + generator.translations + generator.drafts:
+        load_comments(article)
+
+
+def register():
+    """Register the plugin."""
+    signals.article_generator_finalized.connect(load_all_comments)
@@ -0,0 +1,7 @@
+"""Build Support: helpers shared by the site's build steps.
+
+This is not a plugin, and is never listed in PLUGINS: it holds the code which
+the local plugins, ``render_math`` and ``blogger/blogger2rst.py`` have in
+common. ``pelicanconf.py`` puts the ``plugins`` directory on the import path,
+so that it can be imported as ``build_support``.
+"""
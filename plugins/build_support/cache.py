@@ -0,0 +1,37 @@
+"""Pelican file data cache, pruned of the entries a build did not use."""
+
+from pelican.cache import FileDataCacher
+
+
+class PruningCache(FileDataCacher):
+    """Cache of Pelican's CACHE_PATH, which only keeps what the last build used.
+
+    The keys looked up or added during a build are recorded, and every other
+    entry is dropped when the cache is saved, so the cache does not grow with
+    input which no longer exists.
+
+    Entries added during a build are kept for the rest of the build whatever
+    the caching policy, which only decides whether the cache is saved.
+    """
+
+    def __init__(self, settings, cache_name, caching_policy, load_policy):
+        super().__init__(settings, cache_name, caching_policy, load_policy)
+        self.used = set()
+
+    def get(self, key):
+        """Return the data of the key, or None, and record that it is used."""
+        self.used.add(key)
+        return self.get_cached_data(key)
+
+    def put(self, key, data):
+        """Set the data of the key, and record that it is used."""
+        self.used.add(key)
+        self._cache[key] = data
+
+    def unused(self):
+        """Return the keys of the entries which were not used by this build."""
+        return self._cache.keys() - self.used
+
+    def save_cache(self):
+        self._cache = {key: self._cache[key] for key in self.used if key in self._cache}
+        super().save_cache()
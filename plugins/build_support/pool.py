@@ -0,0 +1,33 @@
+"""Pools of worker processes for the build steps which use several cores."""
+
+from concurrent.futures import ProcessPoolExecutor
+import pickle
+
+
+def process_map(function, items, workers, initializer=None, initargs=()):
+    """Return the results of the function over the items, in their order.
+
+    With more than one worker, the items are spread over a pool of that many
+    processes, started with the initializer. Each process is handed about a
+    quarter of its share at a time, so that one slow batch does not leave the
+    others idle at the end. With one worker, the function runs in the calling
+    process, which already holds whatever state the initializer would set up.
+    """
+    items = list(items)
+    if workers <= 1:
+        return [function(item) for item in items]
+
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        return list(executor.map(function, items, chunksize=chunksize))
+
+
+def picklable(obj):
+    """Tell whether the object can be sent to worker processes."""
+    try:
+        pickle.dumps(obj)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
@@ -0,0 +1,93 @@
+"""Content-addressed store of files, pruned of the entries a run did not use.
+
+Every entry is named after a hash of what it was made from, and lives in a
+subdirectory named after the first two characters of the hash, so that no
+directory grows too large. An entry is either a single file, or a directory of
+files made from the same input.
+
+The keys looked up or added during a run are recorded, and ``prune`` deletes
+every other entry once the run is over, so the store only holds what the last
+run needed instead of every version of the input it ever saw. Runs sharing a
+store must therefore not overlap.
+"""
+
+import contextlib
+import hashlib
+import os
+import shutil
+import uuid
+
+
+class ContentStore:
+    """Entries of a directory, keyed on the hash of their input."""
+
+    def __init__(self, path, suffix=""):
+        self.path = path
+        self.suffix = suffix
+        self.used = set()
+
+    @staticmethod
+    def key(*parts):
+        """Hash the parts, text or bytes, into a key."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8") if isinstance(part, str) else part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def filename(self, key):
+        """Return the path of the entry, and record that the run uses it."""
+        self.used.add(key)
+        return os.path.join(self.path, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """Return the text of the entry, or None if there is none."""
+        try:
+            with open(self.filename(key), encoding="utf-8") as entry:
+                return entry.read()
+        except OSError:
+            return None
+
+    def put(self, key, text):
+        """Store the text as the entry of the key."""
+        filename = self.filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # Write to a temporary file first so that processes reading the store
+        # never see a partially written entry
+        tmp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as entry:
+            entry.write(text)
+        os.replace(tmp_filename, filename)
+
+    def prune(self):
+        """Delete the entries not used since the last pruning, and return how many.
+
+        The record of the keys used is reset, for the next run.
+        """
+        kept = {key + self.suffix for key in self.used}
+        pruned = 0
+        try:
+            subdirs = os.listdir(self.path)
+        except OSError:
+            subdirs = []
+        for subdir in subdirs:
+            subdir_path = os.path.join(self.path, subdir)
+            if len(subdir) != 2 or not os.path.isdir(subdir_path):
+                continue
+            for name in os.listdir(subdir_path):
+                if name in kept:
+                    continue
+                entry = os.path.join(subdir_path, name)
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(entry)
+                    except OSError:
+                        continue
+                pruned += 1
+            # Only succeeds once every entry of the subdirectory is pruned
+            with contextlib.suppress(OSError):
+                os.rmdir(subdir_path)
+        self.used.clear()
+        return pruned
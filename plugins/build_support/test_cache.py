@@ -0,0 +1,43 @@
+from tempfile import TemporaryDirectory
+import unittest
+
+from pelican.tests.support import get_settings
+
+from .cache import PruningCache
+
+
+class PruningCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.settings = get_settings(CACHE_PATH=self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def cache(self, caching_policy=True):
+        return PruningCache(self.settings, "test", caching_policy, True)
+
+    def test_unused_entries_are_dropped(self):
+        cache = self.cache()
+        cache.put("old", 1)
+        cache.put("kept", 2)
+        cache.save_cache()
+
+        # The next build only uses one of the entries
+        cache = self.cache()
+        self.assertEqual(cache.get("kept"), 2)
+        self.assertIsNone(cache.get("new"))
+        self.assertEqual(cache.unused(), {"old"})
+        cache.save_cache()
+
+        cache = self.cache()
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual(cache.get("kept"), 2)
+
+    def test_entries_are_kept_for_the_build_without_caching(self):
+        cache = self.cache(caching_policy=False)
+        cache.put("key", 1)
+        self.assertEqual(cache.get("key"), 1)
+        cache.save_cache()
+
+        self.assertIsNone(self.cache().get("key"))
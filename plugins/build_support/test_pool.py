@@ -0,0 +1,30 @@
+import os
+import unittest
+
+from .pool import picklable, process_map
+
+
+def square(n):
+    """Square the number, in whichever process runs it."""
+    return n * n
+
+
+def process_id(_):
+    """Return the id of the process running the function."""
+    return os.getpid()
+
+
+class ProcessMapTest(unittest.TestCase):
+    def test_results_are_in_order(self):
+        for workers in (1, 2):
+            self.assertEqual(
+                process_map(square, range(20), workers), [n * n for n in range(20)]
+            )
+
+    def test_one_worker_runs_in_the_calling_process(self):
+        self.assertEqual(process_map(process_id, [1, 2], 1), [os.getpid()] * 2)
+        self.assertNotIn(os.getpid(), process_map(process_id, [1, 2], 2))
+
+    def test_picklable(self):
+        self.assertTrue(picklable(square))
+        self.assertFalse(picklable(lambda n: n))
@@ -0,0 +1,44 @@
+import os
+from os.path import exists
+from tempfile import TemporaryDirectory
+import unittest
+
+from .store import ContentStore
+
+
+class ContentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.store = ContentStore(self.tmpdir.name, ".html")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_entries_are_read_back(self):
+        key = self.store.key("inline", "x^2")
+        self.assertIsNone(self.store.get(key))
+        self.store.put(key, "<mi>x</mi>")
+        self.assertEqual(self.store.get(key), "<mi>x</mi>")
+        self.assertNotEqual(key, self.store.key("display", "x^2"))
+
+    def test_unused_entries_are_pruned(self):
+        old, kept = self.store.key("old"), self.store.key("kept")
+        self.store.put(old, "old")
+        self.store.put(kept, "kept")
+        os.makedirs(self.store.filename(self.store.key("directory")))
+        self.assertEqual(self.store.prune(), 0)
+
+        # The next run only uses one of the entries
+        self.assertEqual(self.store.get(kept), "kept")
+        self.assertEqual(self.store.prune(), 2)
+        self.assertFalse(exists(self.store.filename(old)))
+        self.assertEqual(self.store.get(kept), "kept")
+
+        # Nothing is used at all
+        self.store.used.clear()
+        self.assertEqual(self.store.prune(), 1)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_missing_store_is_pruned(self):
+        store = ContentStore(os.path.join(self.tmpdir.name, "missing"))
+        self.assertEqual(store.prune(), 0)
@@ -0,0 +1,119 @@
+"""Parallel Read: parse the sources of the site over a pool of processes.
+
+Pelican reads and parses every source file one after the other. Parsing
+reStructuredText with docutils dominates the build of large sites, so before
+the articles or pages generator reads its first file, this plugin parses all
+the files it is about to read in the formats of ``PARALLEL_READ_FORMATS``, over
+a pool of ``PARALLEL_READ_WORKERS`` worker processes, and stores the results in
+the reader cache of the generator, which Pelican then reads them from. The pool
+is opt-in: with the default of one worker, files are left to Pelican.
+
+Files which did not change since the previous build are found in the reader
+cache, and are not parsed again. The plugin thus relies on Pelican's content
+cache at the reader layer (``CACHE_CONTENT = True`` and
+``CONTENT_CACHING_LAYER = "reader"``, the default), and does nothing without
+it.
+"""
+
+import logging
+import os
+import time
+
+from build_support.pool import picklable, process_map
+
+from pelican import signals
+from pelican.readers import _filter_discardable_metadata
+from pelican.utils import file_suffix
+
+logger = logging.getLogger(__name__)
+
+
+def picklable_settings(settings):
+    """Return the settings which can be sent to worker processes."""
+    return {key: value for key, value in settings.items() if picklable(value)}
+
+
+def set_worker_readers(reader_classes, settings):
+    """Create the readers of the formats read in parallel, in a worker process."""
+    read_source.readers = {
+        fmt: reader_class(settings) for fmt, reader_class in reader_classes.items()
+    }
+
+
+def read_source(path):
+    """Parse a source file in a worker process, like Pelican's readers do."""
+    content, metadata = read_source.readers[file_suffix(path)].read(path)
+    return path, content, _filter_discardable_metadata(metadata)
+
+
+read_source.readers = {}
+
+
+def preread(generator, paths, exclude):
+    """Parse the files of the generator missing from its reader cache."""
+    if getattr(generator, "parallel_read_done", False):
+        return
+    generator.parallel_read_done = True
+
+    settings = generator.settings
+    readers = generator.readers
+    workers = max(1, settings.get("PARALLEL_READ_WORKERS", 1))
+    if workers == 1 or not (
+        settings.get("CACHE_CONTENT", False)
+        and settings["CONTENT_CACHING_LAYER"] == "reader"
+    ):
+        return
+
+    formats = settings.get("PARALLEL_READ_FORMATS", ["rst"])
+    reader_classes = {
+        fmt: readers.readers[fmt].__class__ for fmt in formats if fmt in readers.readers
+    }
+    files = [
+        os.path.abspath(os.path.join(generator.path, path))
+        for path in sorted(generator.get_files(paths, exclude=exclude))
+    ]
+    missing = [
+        path
+        for path in files
+        if file_suffix(path) in reader_classes
+        and readers.get_cached_data(path, None) is None
+    ]
+    if not missing:
+        return
+
+    start = time.perf_counter()
+    results = process_map(
+        read_source,
+        missing,
+        workers,
+        initializer=set_worker_readers,
+        initargs=(reader_classes, picklable_settings(settings)),
+    )
+    for path, content, metadata in results:
+        readers.cache_data(path, (content, metadata))
+
+    logger.info(
+        "parallel_read: %d of %d files parsed in %.2f s with %d workers",
+        len(missing),
+        len(files),
+        time.perf_counter() - start,
+        workers,
+    )
+
+
+def preread_articles(generator):
+    """Parse the articles before the articles generator reads them."""
+    settings = generator.settings
+    preread(generator, settings["ARTICLE_PATHS"], settings["ARTICLE_EXCLUDES"])
+
+
+def preread_pages(generator):
+    """Parse the pages before the pages generator reads them."""
+    settings = generator.settings
+    preread(generator, settings["PAGE_PATHS"], settings["PAGE_EXCLUDES"])
+
+
+def register():
+    """Register the plugin."""
+    signals.article_generator_preread.connect(preread_articles)
+    signals.page_generator_preread.connect(preread_pages)
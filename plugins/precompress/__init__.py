@@ -0,0 +1,193 @@
+"""Precompress: write gzip and Brotli compressed copies of the output.
+
+Once the site is written, every compressible file of the output directory
+(HTML, CSS, JavaScript, feeds, ...) gets ``.gz`` and ``.br`` siblings, so that
+the web server or a proxy in front of it can send precompressed bytes without
+compressing anything per request. Compression runs in the build process
+unless ``PRECOMPRESS_WORKERS`` asks for a pool of processes.
+
+Brotli is only used when the ``brotli`` package is installed.
+
+The hash and the stamp (size and modification time) of every compressed file
+are kept in Pelican's CACHE_PATH, per path in the output, along with the stamps
+of the siblings written for it. Files whose content did not change since the
+last build are not compressed again, as long as their siblings are still there
+with the stamps they were written with; otherwise, e.g. when the output
+directory was deleted between builds (DELETE_OUTPUT_DIRECTORY), they are.
+Files whose stamp did not change are not even read. Entries of files which are
+no longer in the output are dropped, and their siblings removed.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+
+from build_support.cache import PruningCache
+from build_support.pool import process_map
+
+from pelican import signals
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Extensions of the files which are compressed, unless set in PRECOMPRESS_EXTENSIONS
+DEFAULT_EXTENSIONS = (
+    ".atom",
+    ".css",
+    ".html",
+    ".js",
+    ".json",
+    ".rss",
+    ".svg",
+    ".txt",
+    ".xml",
+)
+
+# Files smaller than this are not worth compressing
+MIN_SIZE = 256
+
+
+def compress_gzip(data):
+    """Compress with gzip, with a fixed mtime so the output is reproducible."""
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    """Compress with Brotli."""
+    return brotli.compress(data, quality=11)
+
+
+def encodings():
+    """Return the available compressions, by extension of the compressed files."""
+    available = {".gz": compress_gzip}
+    if brotli is not None:
+        available[".br"] = compress_brotli
+    return available
+
+
+def stamp(filename):
+    """Return the size and modification time of the file, or None if it is missing."""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PrecompressCache(PruningCache):
+    """Stamp, hash and sibling stamps of the output files, per path in the output."""
+
+    def __init__(self, settings):
+        super().__init__(settings, "precompress", True, True)
+
+
+def compress_file(filename):
+    """Write the compressed siblings of a file, and return their stamps.
+
+    Siblings which are not smaller than the file are removed, and their stamp
+    is None.
+    """
+    with open(filename, "rb") as source:
+        data = source.read()
+    siblings = {}
+    for extension, compress in encodings().items():
+        sibling = filename + extension
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            if os.path.exists(sibling):
+                os.remove(sibling)
+        else:
+            with open(sibling, "wb") as compressed_file:
+                compressed_file.write(compressed)
+        siblings[extension] = stamp(sibling)
+    return siblings
+
+
+def siblings_intact(filename, siblings):
+    """Tell whether the siblings of a file are as they were written."""
+    return siblings.keys() == encodings().keys() and all(
+        stamp(filename + extension) == sibling_stamp
+        for extension, sibling_stamp in siblings.items()
+    )
+
+
+def find_files(output_path, extensions):
+    """Return the files of the output to compress."""
+    files = []
+    for dirpath, _, filenames in os.walk(output_path):
+        for name in filenames:
+            filename = os.path.join(dirpath, name)
+            if (
+                os.path.splitext(name)[1] in extensions
+                and os.path.getsize(filename) >= MIN_SIZE
+            ):
+                files.append(filename)
+    return sorted(files)
+
+
+def remove_siblings(filename):
+    """Remove the compressed siblings of a file which is no longer compressed."""
+    for extension in (".gz", ".br"):
+        if os.path.exists(filename + extension):
+            os.remove(filename + extension)
+
+
+def precompress(pelicanobj):
+    """Write the compressed siblings of the output files."""
+    settings = pelicanobj.settings
+    output_path = pelicanobj.output_path
+    extensions = tuple(settings.get("PRECOMPRESS_EXTENSIONS", DEFAULT_EXTENSIONS))
+    workers = max(1, settings.get("PRECOMPRESS_WORKERS", 1))
+
+    if brotli is None:
+        logger.info("precompress: brotli is not installed, only writing .gz files")
+
+    cache = PrecompressCache(settings)
+    files = {}
+    missing = []
+    for filename in find_files(output_path, extensions):
+        path = os.path.relpath(filename, output_path)
+        file_stamp = stamp(filename)
+        cached = cache.get(path)
+        if cached is not None and cached[0] == file_stamp:
+            digest = cached[1]
+        else:
+            with open(filename, "rb") as source:
+                digest = hashlib.sha256(source.read()).hexdigest()
+        files[filename] = path, file_stamp, digest
+        if (
+            cached is not None
+            and cached[1] == digest
+            and siblings_intact(filename, cached[2])
+        ):
+            cache.put(path, (file_stamp, digest, cached[2]))
+        else:
+            missing.append(filename)
+
+    results = process_map(compress_file, missing, workers if len(missing) > 1 else 1)
+    for filename, siblings in zip(missing, results):
+        path, file_stamp, digest = files[filename]
+        cache.put(path, (file_stamp, digest, siblings))
+
+    # Siblings of files which were removed from the output, or shrank
+    for path in cache.unused():
+        remove_siblings(os.path.join(output_path, path))
+    cache.save_cache()
+
+    logger.info(
+        "precompress: %d files, %d compressed, %d unchanged (%s)",
+        len(files),
+        len(missing),
+        len(files) - len(missing),
+        ", ".join(encodings()),
+    )
+
+
+def register():
+    """Register the plugin."""
+    signals.finalized.connect(precompress)
@@ -0,0 +1,101 @@
+import gzip
+import os
+from os.path import exists, join
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from pelican.tests.support import get_settings, unittest
+
+from . import PrecompressCache, compress_file, encodings, precompress
+
+PAGE = b"<html><body>" + b"<p>Compressible text.</p>" * 100 + b"</body></html>"
+
+
+class PelicanMock:
+    """Dummy class exposing the only attributes needed."""
+
+    def __init__(self, settings, output_path):
+        self.settings = settings
+        self.output_path = output_path
+
+
+class PrecompressTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.output_path = join(self.tmpdir.name, "output")
+        os.makedirs(self.output_path)
+        settings = get_settings(filenames={})
+        settings["CACHE_PATH"] = join(self.tmpdir.name, "cache")
+        settings["PRECOMPRESS_WORKERS"] = 1
+        self.pelican = PelicanMock(settings, self.output_path)
+        self.write("index.html", PAGE)
+        self.write("other.html", PAGE.replace(b"text", b"words"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, data):
+        with open(join(self.output_path, name), "wb") as f:
+            f.write(data)
+
+    def build(self):
+        """Run the plugin, and return the files it compressed."""
+        package = PrecompressTest.__module__.rsplit(".", 1)[0]
+        with mock.patch(f"{package}.compress_file", wraps=compress_file) as compress:
+            precompress(self.pelican)
+        return sorted(
+            os.path.relpath(call.args[0], self.output_path)
+            for call in compress.call_args_list
+        )
+
+    def test_compress_file(self):
+        siblings = compress_file(join(self.output_path, "index.html"))
+        self.assertEqual(siblings.keys(), encodings().keys())
+        with open(join(self.output_path, "index.html.gz"), "rb") as f:
+            data = f.read()
+        self.assertEqual(gzip.decompress(data), PAGE)
+        self.assertEqual(siblings[".gz"][0], len(data))
+
+    def test_unchanged_files_are_not_compressed_again(self):
+        self.assertEqual(self.build(), ["index.html", "other.html"])
+        with open(join(self.output_path, "index.html.gz"), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), PAGE)
+        mtime = os.stat(join(self.output_path, "index.html.gz")).st_mtime_ns
+
+        # Pelican writes every file again, mostly with the same content
+        self.write("index.html", PAGE)
+        self.write("other.html", PAGE.replace(b"text", b"lines"))
+        self.assertEqual(self.build(), ["other.html"])
+        self.assertEqual(
+            os.stat(join(self.output_path, "index.html.gz")).st_mtime_ns, mtime
+        )
+
+    def test_files_with_the_same_stamp_are_not_read(self):
+        self.build()
+        package = PrecompressTest.__module__.rsplit(".", 1)[0]
+        with mock.patch(f"{package}.open", create=True) as read:
+            self.assertEqual(self.build(), [])
+        read.assert_not_called()
+
+    def test_deleted_or_altered_siblings_are_written_again(self):
+        self.build()
+        os.remove(join(self.output_path, "index.html.gz"))
+        self.write("other.html.gz", b"truncated")
+
+        self.assertEqual(self.build(), ["index.html", "other.html"])
+        with open(join(self.output_path, "index.html.gz"), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), PAGE)
+
+    def test_siblings_of_removed_files_are_removed(self):
+        self.write("unrelated.html.gz", b"not ours")
+        self.build()
+        os.remove(join(self.output_path, "other.html"))
+
+        self.assertEqual(self.build(), [])
+        self.assertFalse(exists(join(self.output_path, "other.html.gz")))
+        self.assertTrue(exists(join(self.output_path, "index.html.gz")))
+        self.assertTrue(exists(join(self.output_path, "unrelated.html.gz")))
+
+        cache = PrecompressCache(self.pelican.settings)
+        self.assertIsNone(cache.get("other.html"))
+        self.assertIsNotNone(cache.get("index.html"))
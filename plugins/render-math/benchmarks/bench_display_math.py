@@ -0,0 +1,119 @@
+"""Benchmark the correction of displayed math against the previous implementation.
+
+The previous implementation looked up the position of every displayed formula
+and of every corrected paragraph with ``list.index``, which is quadratic in the
+number of paragraphs and formulas. The current one corrects the tree in a
+single pass.
+
+Run from the root of the plugin:
+
+    PYTHONPATH=.. python -m benchmarks.bench_display_math --equations 5000
+"""
+
+import argparse
+import time
+from xml.etree.ElementTree import Element
+
+import markdown
+
+from pelican.plugins.render_math.pelican_mathjax_markdown_extension import (
+    PelicanMathJaxCorrectDisplayMath,
+    PelicanMathJaxExtension,
+)
+
+
+class LegacyCorrectDisplayMath(PelicanMathJaxCorrectDisplayMath):
+    """Correct displayed math the way the plugin did before the single pass."""
+
+    def correct_html(self, root, children, div_math, insert_idx, text):
+        current_idx = 0
+
+        for idx in div_math:
+            el = Element("p")
+            el.text = text
+            el.extend(children[current_idx:idx])
+
+            if len(el) != 0 or (el.text and not el.text.isspace()):
+                root.insert(insert_idx, el)
+                insert_idx += 1
+
+            text = children[idx].tail
+            children[idx].tail = None
+            root.insert(insert_idx, children[idx])
+            insert_idx += 1
+            current_idx = idx + 1
+
+        el = Element("p")
+        el.text = text
+        el.extend(children[current_idx:])
+
+        if len(el) != 0 or (el.text and not el.text.isspace()):
+            root.insert(insert_idx, el)
+
+    def run(self, root):
+        math_tag_class = self.pelican_mathjax_extension.getConfig("math_tag_class")
+
+        for parent in root:
+            div_math = []
+            children = list(parent)
+
+            for div in parent.findall("div"):
+                if div.get("class") == math_tag_class:
+                    div_math.append(children.index(div))
+
+            if not div_math:
+                continue
+
+            insert_idx = list(root).index(parent)
+            self.correct_html(root, children, div_math, insert_idx, parent.text)
+            root.remove(parent)
+
+        return root
+
+
+class LegacyExtension(PelicanMathJaxExtension):
+    def extendMarkdown(self, md):
+        super().extendMarkdown(md)
+        md.treeprocessors.register(
+            LegacyCorrectDisplayMath(self), "mathjax_correctdisplayedmath", 15
+        )
+
+
+def make_document(equations):
+    """Build a document with paragraphs mixing text and displayed math."""
+    return "\n\n".join(
+        f"Paragraph {n} with $x_{{{n}}}$ inline, then $$y_{{{n}}} = x_{{{n}}}^2$$ "
+        f"displayed and $$z_{{{n}}}$$ again, followed by text."
+        for n in range(equations // 2)
+    )
+
+
+def convert(extension_class, text):
+    """Return the time taken to convert the text, and the resulting HTML."""
+    config = {"mathjax_script": "", "math_tag_class": "math", "auto_insert": False}
+    md = markdown.Markdown(extensions=[extension_class(config)])
+    start = time.perf_counter()
+    html = md.convert(text)
+    return time.perf_counter() - start, html
+
+
+def main():
+    """Compare both implementations on a synthetic document."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--equations", type=int, default=5000)
+    args = parser.parse_args()
+
+    text = make_document(args.equations)
+    legacy, legacy_html = convert(LegacyExtension, text)
+    current, html = convert(PelicanMathJaxExtension, text)
+
+    assert html == legacy_html
+
+    print(f"{args.equations} displayed equations")
+    print(f"  list.index lookups: {legacy:8.3f} s")
+    print(f"  single pass:        {current:8.3f} s")
+    print(f"  speedup:            {legacy / current:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
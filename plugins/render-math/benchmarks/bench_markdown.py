@@ -0,0 +1,158 @@
+"""Benchmark the Markdown math matcher against the previous implementation.
+
+The previous implementation registered two regex patterns, one for displayed and
+one for inline math, each with lazy quantifiers and backreferences. The current
+one finds all delimiters in a single linear scan.
+
+Both are run over the Markdown posts of the site, and over a paragraph of
+unbalanced dollars which made the previous patterns backtrack.
+
+Run from the root of the plugin:
+
+    PYTHONPATH=.. python -m benchmarks.bench_markdown --content ../../content
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import markdown
+
+from pelican.plugins.render_math.pelican_mathjax_markdown_extension import (
+    PelicanMathJaxExtension,
+    PelicanMathJaxPattern,
+)
+
+
+class LegacyExtension(PelicanMathJaxExtension):
+    """Match math with the two regex patterns used before the single scan."""
+
+    def extendMarkdown(self, md):
+        super().extendMarkdown(md)
+        md.inlinePatterns.deregister("mathjax")
+
+        mathjax_inline_regex = r"(?P<prefix>\$)(?P<math>.+?)(?P<suffix>(?<!\s)\2)"
+        mathjax_display_regex = (
+            r"(?P<prefix>\$\$|\\begin\{(.+?)\})(?P<math>.+?)(?P<suffix>\2|\\end\{\3\})"
+        )
+        md.inlinePatterns.register(
+            PelicanMathJaxPattern(self, "div", mathjax_display_regex),
+            "mathjax_displayed",
+            186,
+        )
+        md.inlinePatterns.register(
+            PelicanMathJaxPattern(self, "span", mathjax_inline_regex),
+            "mathjax_inlined",
+            185,
+        )
+
+
+def make_markdown(extension_class):
+    """Return a Markdown converter using the given math extension."""
+    config = {"mathjax_script": "", "math_tag_class": "math", "auto_insert": False}
+    return markdown.Markdown(extensions=[extension_class(config)])
+
+
+def inline_patterns(extension_class):
+    """Return the math patterns registered by the extension, by priority."""
+    md = make_markdown(extension_class)
+    return [
+        pattern
+        for pattern in md.inlinePatterns
+        if hasattr(pattern, "pelican_mathjax_extension")
+    ]
+
+
+def apply_patterns(patterns, text):
+    """Apply the patterns to the text the way Python-Markdown does.
+
+    Matched math is replaced by a placeholder, and the number of matches is
+    returned.
+    """
+    matches = 0
+    for pattern in patterns:
+        start = 0
+        while True:
+            if isinstance(pattern, markdown.inlinepatterns.InlineProcessor):
+                m = pattern.getCompiledRegExp().search(text, start)
+                if m is None:
+                    break
+                node, begin, end = pattern.handleMatch(m, text)
+                if node is None:
+                    start = m.end(0)
+                    continue
+                text = text[:begin] + "\x02" + text[end:]
+                start = begin + 1
+            else:
+                m = pattern.getCompiledRegExp().match(text[start:])
+                if m is None:
+                    break
+                pattern.handleMatch(m)
+                text = text[:start] + m.group(1) + "\x02" + m.groups()[-1]
+                start += len(m.group(1)) + 1
+            matches += 1
+    return matches
+
+
+def match_all(extension_class, paragraphs, repeat):
+    """Return the time taken to match math in all paragraphs, and the matches."""
+    patterns = inline_patterns(extension_class)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        matches = sum(apply_patterns(patterns, text) for text in paragraphs)
+    return time.perf_counter() - start, matches
+
+
+def convert_all(extension_class, texts):
+    """Convert all texts to HTML."""
+    md = make_markdown(extension_class)
+    html = []
+    for text in texts:
+        md.reset()
+        html.append(md.convert(text))
+    return html
+
+
+def compare(name, texts, repeat):
+    """Match math with both matchers and print their throughput."""
+    assert convert_all(LegacyExtension, texts) == convert_all(
+        PelicanMathJaxExtension, texts
+    )
+
+    paragraphs = [p for text in texts for p in text.split("\n\n")]
+    size = sum(len(p) for p in paragraphs) * repeat / 1e6
+    legacy, legacy_matches = match_all(LegacyExtension, paragraphs, repeat)
+    current, matches = match_all(PelicanMathJaxExtension, paragraphs, repeat)
+
+    assert matches == legacy_matches
+
+    print(f"{name} ({matches} formulas)")
+    print(f"  two regex patterns: {size / legacy:8.2f} MB/s ({legacy:.3f} s)")
+    print(f"  single scan:        {size / current:8.2f} MB/s ({current:.3f} s)")
+    print(f"  speedup:            {legacy / current:8.1f}x")
+
+
+def main():
+    """Compare both matchers on the site content and on unbalanced dollars."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--content", default=os.path.join("..", "..", "content"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dollars", type=int, default=2000)
+    args = parser.parse_args()
+
+    paths = sorted(
+        glob.glob(os.path.join(args.content, "*.md"))
+        + glob.glob(os.path.join(args.content, "*.markdown"))
+    )
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as post:
+            texts.append(post.read())
+
+    compare(f"{len(texts)} posts from {args.content}", texts, args.repeat)
+    compare(f"{args.dollars} unbalanced dollars", ["$ " * args.dollars], 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark summary processing against the previous implementation.
+
+The previous implementation parsed the full HTML of the article with
+BeautifulSoup whenever the last formula of the summary was truncated. The current
+one looks the formula up in the math index recorded when the article was read.
+
+Run from the root of the plugin:
+
+    PYTHONPATH=.. python -m benchmarks.bench_process_summary --articles 2000
+"""
+
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from pelican.plugins.render_math.math import index_math, pelican_init, process_summary
+from pelican.tests.support import get_settings
+
+
+class Article:
+    """Minimal stand-in for a Pelican article."""
+
+    def __init__(self, content, summary):
+        self._content = content
+        self.metadata = {"summary": summary}
+
+    def get_summary(self, siteurl):
+        return self.metadata["summary"]
+
+    @property
+    def summary(self):
+        return self.get_summary("")
+
+
+def legacy_process_summary(article):
+    """Process the summary the way the plugin did before the math index."""
+    summary = article.summary
+    summary_parsed = BeautifulSoup(summary, "html.parser")
+    math = summary_parsed.find_all(class_="math")
+
+    if len(math) > 0:
+        last_math_text = math[-1].get_text()
+        if len(last_math_text) > 3 and last_math_text[-3:] == "...":
+            content_parsed = BeautifulSoup(article._content, "html.parser")
+            full_text = content_parsed.find_all(class_="math")[len(math) - 1].get_text()
+            math[-1].string = "%s ..." % full_text
+            summary = summary_parsed.decode()
+
+        article.metadata["summary"] = (
+            f"{summary}<script type='text/javascript'>{process_summary.mathjax_script}</script>"
+        )
+
+
+def make_article(index, paragraphs):
+    """Build an article whose summary ends in a truncated formula."""
+    body = "".join(
+        f"<p>Paragraph {n} of article {index} states that "
+        f'<span class="math">\\(a_{{{n}}} = \\sum_{{k=0}}^{{{n}}} k^2\\)</span> '
+        "and the following holds.</p>"
+        f'<div class="math">$$\\int_0^{{{n}}} x^2 \\, dx = {n}^3 / 3$$</div>'
+        for n in range(paragraphs)
+    )
+    summary = (
+        f'<p>Paragraph 0 of article {index} states that <span class="math">\\(a_{{0}} = ...'
+        "</span></p>"
+    )
+    return Article(body, summary)
+
+
+def run(process, articles):
+    """Return the time taken to process the summaries of all articles."""
+    start = time.perf_counter()
+    for article in articles:
+        process(article)
+    return time.perf_counter() - start
+
+
+def main():
+    """Compare both implementations over synthetic articles."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=1000)
+    parser.add_argument("--paragraphs", type=int, default=50)
+    args = parser.parse_args()
+
+    pelican_init(type("Pelican", (), {"settings": get_settings()})())
+
+    legacy_articles = [make_article(i, args.paragraphs) for i in range(args.articles)]
+    articles = [make_article(i, args.paragraphs) for i in range(args.articles)]
+
+    legacy = run(legacy_process_summary, legacy_articles)
+    start = time.perf_counter()
+    for article in articles:
+        index_math(article)
+    indexing = time.perf_counter() - start
+    current = run(process_summary, articles)
+
+    assert [a.summary for a in articles] == [a.summary for a in legacy_articles]
+
+    print(f"{args.articles} articles, {args.paragraphs} paragraphs each")
+    print(f"  full HTML parse: {legacy:8.3f} s")
+    print(f"  math index:      {current + indexing:8.3f} s (indexing {indexing:.3f} s)")
+    print(f"  speedup:         {legacy / (current + indexing):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Benchmark the plugin over synthetic corpora of articles.
+
+A corpus of Markdown, reStructuredText and Jupyter notebook articles is
+generated with a configurable number of articles, paragraphs per article and
+math density (the probability for a paragraph to contain math). The corpus is
+then run through the same steps as a Pelican build: ``pelican_init``, reading
+the articles with an ``ArticlesGenerator`` and ``process_rst_and_summaries``.
+
+The throughput, the peak memory and the time spent in each phase, as recorded by
+the plugin's profiling, are reported. Timings are the best of ``--repeat`` runs;
+the peak memory is measured in a separate run, since tracing allocations slows
+the build down.
+
+Notebooks are only read when the pelican-ipynb plugin is installed.
+
+Run from the root of the plugin:
+
+    PYTHONPATH=.. python -m benchmarks.suite --articles 200 --density 0.5
+
+or through invoke:
+
+    invoke benchmark --articles 200 --density 0.5
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import random
+from tempfile import TemporaryDirectory
+import time
+import tracemalloc
+
+from pelican import Pelican
+from pelican.generators import ArticlesGenerator
+from pelican.plugins.render_math.math import (
+    pelican_init,
+    process_rst_and_summaries,
+    profiled,
+)
+from pelican.settings import configure_settings
+from pelican.tests.support import get_settings
+
+FORMATS = ("md", "rst", "ipynb")
+
+WORDS = [
+    "lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit",
+    "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore",
+    "magna", "aliqua", "enim", "ad", "minim", "veniam", "quis", "nostrud",
+]  # fmt: skip
+
+
+def make_formula(rng):
+    """Return a random TeX formula."""
+    n = rng.randint(1, 9)
+    return rng.choice(
+        (
+            f"x_{{{n}}}^2 + y_{{{n}}}^2 = r^2",
+            f"\\sum_{{k=0}}^{{{n}}} k^2 = \\frac{{{n}({n}+1)(2 \\cdot {n}+1)}}{{6}}",
+            f"\\int_0^{{{n}}} e^{{-t}} \\, dt",
+            f"A = L L^T + {n} I",
+        )
+    )
+
+
+def make_paragraphs(rng, paragraphs, density):
+    """Return the paragraphs of an article, as (words, inline, displayed) tuples.
+
+    A paragraph has math with probability ``density``: an inline formula, and
+    one time out of three a displayed formula as well.
+    """
+    result = []
+    for _ in range(paragraphs):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 60)))
+        inline = displayed = None
+        if rng.random() < density:
+            inline = make_formula(rng)
+            if rng.random() < 1 / 3:
+                displayed = make_formula(rng)
+        result.append((words, inline, displayed))
+    return result
+
+
+def markdown_body(paragraphs):
+    """Return the paragraphs in Markdown."""
+    blocks = []
+    for words, inline, displayed in paragraphs:
+        if inline is not None:
+            words = f"{words} ${inline}$ {words[:40]}"
+        blocks.append(words)
+        if displayed is not None:
+            blocks.append(f"$${displayed}$$")
+    return "\n\n".join(blocks) + "\n"
+
+
+def rst_body(paragraphs):
+    """Return the paragraphs in reStructuredText."""
+    blocks = []
+    for words, inline, displayed in paragraphs:
+        if inline is not None:
+            words = f"{words} :math:`{inline}` {words[:40]}"
+        blocks.append(words)
+        if displayed is not None:
+            blocks.append(f".. math::\n\n   {displayed}")
+    return "\n\n".join(blocks) + "\n"
+
+
+def notebook(paragraphs):
+    """Return a notebook with one Markdown cell per paragraph."""
+    cells = [
+        {"cell_type": "markdown", "metadata": {}, "source": [block]}
+        for block in markdown_body(paragraphs).split("\n\n")
+    ]
+    return json.dumps(
+        {
+            "cells": cells,
+            "metadata": {"language_info": {"name": "python"}},
+            "nbformat": 4,
+            "nbformat_minor": 2,
+        }
+    )
+
+
+def generate_corpus(path, corpus):
+    """Write a synthetic corpus of articles to path, and return its size in bytes.
+
+    The corpus is described by its number of ``articles``, of ``paragraphs`` per
+    article, its math ``density``, its ``formats`` and the ``seed`` of the
+    random generator. Articles are spread evenly over the formats.
+    """
+    rng = random.Random(corpus["seed"])
+    formats = corpus["formats"]
+    size = 0
+
+    for index in range(corpus["articles"]):
+        fmt = formats[index % len(formats)]
+        body = make_paragraphs(rng, corpus["paragraphs"], corpus["density"])
+        title = f"Article {index}"
+        date = f"2020-01-01 00:{index // 60 % 60:02d}:{index % 60:02d}"
+        files = {}
+
+        if fmt == "md":
+            files["md"] = f"Title: {title}\nDate: {date}\n\n" + markdown_body(body)
+        elif fmt == "rst":
+            files["rst"] = (
+                f"{title}\n{'#' * len(title)}\n\n:date: {date}\n\n" + rst_body(body)
+            )
+        else:
+            files["ipynb"] = notebook(body)
+            files["nbdata"] = f"Title: {title}\nDate: {date}\n"
+
+        for extension, text in files.items():
+            filename = os.path.join(path, f"article-{index}.{extension}")
+            with open(filename, "w", encoding="utf-8") as source:
+                size += source.write(text)
+
+    return size
+
+
+def build(corpus_path, output_path, mathjax_settings):
+    """Run the steps of a build using the plugin, and return the timings.
+
+    Returns the articles read, the wall time of each step and the profile
+    recorded by the plugin.
+    """
+    settings = get_settings(filenames={})
+    settings["PATH"] = corpus_path
+    settings["PLUGINS"] = ["pelican-ipynb.markup"]  # to also read .ipynb files
+    # Each build adds the plugin's extension to the Markdown settings, which are
+    # shared with Pelican's defaults
+    settings["MARKDOWN"] = copy.deepcopy(settings["MARKDOWN"])
+    settings["MATH_JAX"] = dict(mathjax_settings, profile=True)
+    configure_settings(settings)
+    pelican = type("Pelican", (), {"settings": settings, "plugins": []})()
+
+    steps = {}
+    start = time.perf_counter()
+    pelican_init(pelican)
+    Pelican.init_plugins(pelican)
+    steps["pelican_init"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    context = settings.copy()
+    context["generated_content"] = {}
+    context["static_links"] = set()
+    generator = ArticlesGenerator(
+        context=context,
+        settings=settings,
+        path=settings["PATH"],
+        theme=settings["THEME"],
+        output_path=output_path,
+    )
+    generator.generate_context()
+    steps["read articles"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    process_rst_and_summaries([generator])
+    steps["process_rst_and_summaries"] = time.perf_counter() - start
+
+    return generator.articles, steps, profiled.profile.report()
+
+
+def peak_memory(corpus_path, output_path, mathjax_settings):
+    """Return the peak memory allocated during a build, in bytes."""
+    tracemalloc.start()
+    try:
+        build(corpus_path, output_path, mathjax_settings)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(args):
+    """Generate the corpus, build it and return the results."""
+    corpus = {
+        "articles": args.articles,
+        "paragraphs": args.paragraphs,
+        "density": args.density,
+        "formats": args.formats.split(","),
+        "seed": args.seed,
+    }
+    mathjax_settings = {"workers": args.workers}
+    if args.renderer:
+        mathjax_settings["renderer"] = args.renderer
+
+    with TemporaryDirectory() as tmpdirname:
+        corpus_path = os.path.join(tmpdirname, "content")
+        output_path = os.path.join(tmpdirname, "output")
+        os.makedirs(corpus_path)
+        size = generate_corpus(corpus_path, corpus)
+
+        best = None
+        for _ in range(args.repeat):
+            articles, steps, profile = build(corpus_path, output_path, mathjax_settings)
+            if best is None or sum(steps.values()) < sum(best[0].values()):
+                best = steps, profile
+        steps, profile = best
+
+        memory = peak_memory(corpus_path, output_path, mathjax_settings)
+
+    total = sum(steps.values())
+    read = dict.fromkeys(corpus["formats"], 0)
+    for article in articles:
+        read[os.path.splitext(article.source_path)[1][1:]] += 1
+
+    return {
+        "corpus": dict(corpus, bytes=size, read=read),
+        "settings": mathjax_settings,
+        "seconds": total,
+        "articles_per_second": len(articles) / total,
+        "megabytes_per_second": size / 1e6 / total,
+        "peak_memory_bytes": memory,
+        "steps": steps,
+        "phases": profile["phases"],
+        "counters": profile["counters"],
+    }
+
+
+def print_results(results):
+    """Print the results as a human-readable report."""
+    corpus = results["corpus"]
+    read = ", ".join(f"{count} {fmt}" for fmt, count in corpus["read"].items())
+    print(
+        f"{corpus['articles']} articles of {corpus['paragraphs']} paragraphs, "
+        f"math density {corpus['density']}, {corpus['bytes'] / 1e6:.2f} MB "
+        f"({read} read)"
+    )
+    print(
+        f"  total:      {results['seconds']:8.3f} s"
+        f"  ({results['articles_per_second']:.1f} articles/s,"
+        f" {results['megabytes_per_second']:.2f} MB/s)"
+    )
+    print(f"  peak memory: {results['peak_memory_bytes'] / 1e6:7.1f} MB")
+    print("  steps:")
+    for step, seconds in results["steps"].items():
+        print(f"    {step:40} {seconds:8.3f} s")
+    print("  render_math phases:")
+    for phase, timing in sorted(results["phases"].items()):
+        print(f"    {phase:40} {timing['seconds']:8.3f} s {timing['calls']:8d} calls")
+
+
+def main():
+    """Parse the arguments, run the benchmark and report the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.5)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--renderer", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Keep the report readable: Pelican logs every file it reads
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = run(args)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report:
+            json.dump(results, report, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Persistent cache of the content processed by the Render Math plugin.
+
+For every source file, the cache keeps a fingerprint of the source, of the
+content produced by the reader and of the plugin settings, along with the
+content and summary resulting from the plugin's processing. On the next build,
+content whose fingerprint did not change is restored from the cache instead of
+being processed again.
+
+The cache lives in Pelican's CACHE_PATH and follows the CACHE_CONTENT and
+LOAD_CONTENT_CACHE settings, like Pelican's own content cache.
+
+Pelican's own reader cache holds the output of the Markdown extension, MathJax
+script included, and is not invalidated when the plugin settings change. A
+fingerprint of the settings it was written with is kept next to it, and it is
+not loaded for a build whose settings differ.
+"""
+
+import hashlib
+import logging
+import os
+
+from pelican.cache import FileDataCacher
+
+logger = logging.getLogger(__name__)
+
+# File of CACHE_PATH holding the fingerprint of the settings of the reader cache
+STAMP_FILENAME = "render_math_settings"
+
+# Pelican settings which change the summary of content
+SUMMARY_SETTINGS = (
+    "SITEURL",
+    "SUMMARY_END_SUFFIX",
+    "SUMMARY_MAX_LENGTH",
+    "SUMMARY_MAX_PARAGRAPHS",
+)
+
+
+class ProcessedContentCache(FileDataCacher):
+    """Cache of processed content and summaries, per source file."""
+
+    def __init__(self, settings, settings_fingerprint):
+        super().__init__(
+            settings,
+            "render_math_content",
+            settings.get("CACHE_CONTENT", False),
+            settings.get("LOAD_CONTENT_CACHE", False),
+        )
+
+        digest = hashlib.sha256(settings_fingerprint.encode("utf-8"))
+        for key in SUMMARY_SETTINGS:
+            digest.update(repr(settings.get(key)).encode("utf-8"))
+        self.settings_fingerprint = digest.hexdigest()
+
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, content):
+        """Hash the source file and the content read from it."""
+        digest = hashlib.sha256(self.settings_fingerprint.encode("utf-8"))
+        try:
+            with open(content.source_path, "rb") as source:
+                digest.update(source.read())
+        except OSError:
+            pass
+        digest.update((content._content or "").encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, content, fingerprint):
+        """Return the cached (content, summary) for the content, if still valid."""
+        cached = self.get_cached_data(content.source_path)
+        if cached is None or cached[0] != fingerprint:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return cached[1:]
+
+    def put(self, content, fingerprint):
+        """Cache the processed content and summary of the content."""
+        self.cache_data(
+            content.source_path,
+            (fingerprint, content._content, content.metadata.get("summary")),
+        )
+
+
+class ReaderCacheStamp:
+    """Fingerprint of the settings Pelican's reader cache was written with."""
+
+    def __init__(self, settings, fingerprint):
+        self.settings = settings
+        self.fingerprint = fingerprint
+        self.filename = os.path.join(settings["CACHE_PATH"], STAMP_FILENAME)
+        self.load_content_cache = settings.get("LOAD_CONTENT_CACHE", False)
+
+    def is_stale(self):
+        """Tell whether the reader cache was written with other settings."""
+        try:
+            with open(self.filename, encoding="utf-8") as stamp:
+                return stamp.read() != self.fingerprint
+        except OSError:
+            return True
+
+    def check(self):
+        """Do not load the content cache for this build if it is stale."""
+        if self.load_content_cache and self.is_stale():
+            logger.info(
+                "render_math: settings changed, the content cache is not loaded"
+            )
+            self.settings["LOAD_CONTENT_CACHE"] = False
+
+    def save(self):
+        """Record the settings of the reader cache, once all content is read."""
+        self.settings["LOAD_CONTENT_CACHE"] = self.load_content_cache
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename, "w", encoding="utf-8") as stamp:
+            stamp.write(self.fingerprint)
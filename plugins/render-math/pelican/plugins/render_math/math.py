@@ -28,11 +28,20 @@ template builders that want to adjust the look and feel of
 the math. See README for more details.
 """
 
+import contextlib
 import functools
+import hashlib
+import html
+import json
+import logging
 import os
 import sys
+import time
+
+from build_support.pool import picklable, process_map
 
 from pelican import generators, signals
+from pelican.readers import MarkdownReader
 
 try:
     from bs4 import BeautifulSoup
@@ -44,11 +53,23 @@ try:
 except ImportError:
     PelicanMathJaxExtension = None
 
+from .cache import ProcessedContentCache, ReaderCacheStamp
+from .prerender import (
+    MATH_ELEMENT_RE,
+    RENDERERS,
+    RenderCache,
+    prerender_html,
+    settings_fingerprint,
+)
+from .profiling import BuildProfile
+
 try:
     string_type = basestring
 except NameError:
     string_type = str
 
+logger = logging.getLogger(__name__)
+
 
 def process_settings(pelicanobj):
     """Set user-specified MathJax settings (see README for more details)."""
@@ -103,6 +124,27 @@ def process_settings(pelicanobj):
         "TeX",
     ]  # Include in order of preference among TeX, STIX-Web, Asana-Math, Neo-Euler, Gyre-Pagella, Gyre-Termes and Latin-Modern
     mathjax_settings["equation_numbering"] = "none"  # AMS, auto, none
+    mathjax_settings["external_script"] = (
+        False  # if set to true, the script is written once to a static file which pages refer to, instead of being inlined in every page
+    )
+    mathjax_settings["loading"] = (
+        "eager"  # if set to 'lazy', MathJax is only loaded when math approaches the viewport, and typeset as it becomes visible
+    )
+    mathjax_settings["lazy_margin"] = (
+        "200px"  # how close to the viewport math must be for MathJax to be loaded and typeset it, in lazy loading mode
+    )
+    mathjax_settings["workers"] = (
+        1  # number of worker processes applying MathJax to content once all of it is read
+    )
+    mathjax_settings["renderer"] = (
+        None  # if set, math is rendered at build time by this callable instead of by MathJax in the browser
+    )
+    mathjax_settings["cache_path"] = os.path.join(
+        pelicanobj.settings.get("CACHE_PATH", "cache"), "render_math"
+    )  # where formulas rendered at build time are cached
+    mathjax_settings["profile"] = bool(
+        os.environ.get("RENDER_MATH_PROFILE")
+    )  # if set to true, the time spent in each phase of the plugin is written to a JSON report in the output directory
 
     # Source for MathJax
     mathjax_settings["source"] = (
@@ -147,6 +189,15 @@ def process_settings(pelicanobj):
         if key == "auto_insert" and isinstance(value, bool):
             mathjax_settings[key] = value
 
+        if key == "external_script" and isinstance(value, bool):
+            mathjax_settings[key] = value
+
+        if key == "loading" and value in ("eager", "lazy"):
+            mathjax_settings[key] = value
+
+        if key == "lazy_margin" and isinstance(value, string_type):
+            mathjax_settings[key] = value
+
         if key == "process_escapes" and isinstance(value, bool):
             mathjax_settings[key] = "true" if value else "false"
 
@@ -218,31 +269,94 @@ def process_settings(pelicanobj):
         if key == "equation_numbering":
             mathjax_settings[key] = value if value is not None else "none"
 
+        if key == "renderer":
+            if isinstance(value, string_type):
+                if value not in RENDERERS:
+                    print(
+                        "\nUnknown math renderer '%s' for render_math, math will be rendered by MathJax instead.\nAvailable renderers: %s\n"
+                        % (value, ", ".join(RENDERERS))
+                    )
+                    continue
+
+                value = RENDERERS[value]
+
+            if value is None or callable(value):
+                mathjax_settings[key] = value
+
+        if key == "cache_path" and isinstance(value, string_type):
+            mathjax_settings[key] = value
+
+        if key == "workers" and isinstance(value, int) and not isinstance(value, bool):
+            mathjax_settings[key] = max(1, value)
+
+        if key == "profile" and isinstance(value, bool):
+            mathjax_settings[key] = value
+
     return mathjax_settings
 
 
+def math_texts(text):
+    """Return the text of all math elements found in the HTML text."""
+    return [
+        html.unescape(match.group("tex")) for match in MATH_ELEMENT_RE.finditer(text)
+    ]
+
+
+def is_math_element(tag):
+    """Tell whether the parsed tag is a math element, as MATH_ELEMENT_RE does."""
+    return tag.name in ("span", "div") and tag.attrs == {"class": ["math"]}
+
+
+def index_math(content):
+    """Record the text of the math elements of freshly read content.
+
+    This lets process_summary repair truncated formulas with a lookup, instead
+    of parsing the full HTML of the content again.
+    """
+    if process_summary.mathjax_script is None or not content._content:
+        return
+
+    content._math_texts = math_texts(content._content)
+
+
 def process_summary(article):
     """Prevent summary truncation. Insert MathJax script so math will be rendered."""
     summary = article.summary
+
+    # Only summaries with math are processed, so do not bother parsing others
+    if not summary or 'class="math' not in summary:
+        return
+
+    # Math elements are counted like in the index of the content, so that the
+    # last one of the summary is found at the same position there
     summary_parsed = BeautifulSoup(summary, "html.parser")
-    math = summary_parsed.find_all(class_="math")
+    math = summary_parsed.find_all(is_math_element)
 
     if len(math) > 0:
         last_math_text = math[-1].get_text()
         if len(last_math_text) > 3 and last_math_text[-3:] == "...":
-            content_parsed = BeautifulSoup(article._content, "html.parser")
-            full_text = content_parsed.find_all(class_="math")[len(math) - 1].get_text()
-            math[-1].string = "%s ..." % full_text
-            summary = summary_parsed.decode()
-
-        # clear memoization cache
-        if isinstance(article.get_summary, functools.partial):
-            memoize_instance = article.get_summary.func.__self__
-            memoize_instance.cache.clear()
-
-        article.metadata["summary"] = (
-            f"{summary}<script type='text/javascript'>{process_summary.mathjax_script}</script>"
-        )
+            content_math_texts = getattr(article, "_math_texts", None)
+            if content_math_texts is None:
+                content_math_texts = math_texts(article._content)
+            if len(math) <= len(content_math_texts):
+                full_text = content_math_texts[len(math) - 1]
+                math[-1].string = "%s ..." % full_text
+                summary = summary_parsed.decode()
+
+        if process_summary.mathjax_script:
+            summary += mathjax_script_tag(process_summary.mathjax_script)
+
+        set_summary(article, summary)
+
+
+def set_summary(article, summary):
+    """Replace the summary of the article, discarding the memoized one."""
+    # clear memoization cache
+    if isinstance(article.get_summary, functools.partial):
+        memoize_instance = article.get_summary.func.__self__
+        memoize_instance.cache.clear()
+
+    article.metadata["summary"] = summary
 
 
 def configure_typogrify(pelicanobj, mathjax_settings):
@@ -273,14 +387,125 @@ def configure_typogrify(pelicanobj, mathjax_settings):
 
 
 def process_mathjax_script(mathjax_settings):
-    """Load the MathJax script template from file and render with the settings."""
-    # Read the MathJax Javascript template from file
-    with open(
+    """Load the MathJax script template from file and render with the settings.
+
+    The last rendered script is kept in-process, with the settings and the
+    modification time of the template it was rendered from, so that rebuilds in
+    the same process (e.g. with --autoreload) neither read nor render the
+    template again. Other settings replace it rather than adding to it.
+    """
+    template_path = (
         os.path.dirname(os.path.realpath(__file__)) + "/mathjax_script_template"
-    ) as mathjax_script_template:
+    )
+    serialized_settings = json.dumps(mathjax_settings, sort_keys=True, default=str)
+    key = (
+        hashlib.sha256(serialized_settings.encode("utf-8")).hexdigest(),
+        os.stat(template_path).st_mtime_ns,
+    )
+
+    cached = process_mathjax_script.cache
+    if cached is not None and cached[0] == key:
+        process_mathjax_script.hits += 1
+        logger.debug(
+            "render_math: MathJax script cache hit (%d hits, %d misses)",
+            process_mathjax_script.hits,
+            process_mathjax_script.misses,
+        )
+        return cached[1]
+
+    process_mathjax_script.misses += 1
+
+    # Read the MathJax Javascript template from file
+    with open(template_path) as mathjax_script_template:
         mathjax_template = mathjax_script_template.read()
 
-    return mathjax_template.format(**mathjax_settings)
+    mathjax_script = mathjax_template.format(**mathjax_settings)
+    process_mathjax_script.cache = (key, mathjax_script)
+    return mathjax_script
+
+
+process_mathjax_script.cache = None
+process_mathjax_script.hits = 0
+process_mathjax_script.misses = 0
+
+
+def mathjax_script_file(pelicanobj, mathjax_script):
+    """Set up the static file the MathJax script is written to.
+
+    The name of the file is fingerprinted with the hash of the script, so that it
+    can be cached indefinitely by browsers and CDNs.
+    """
+    fingerprint = hashlib.sha256(mathjax_script.encode("utf-8")).hexdigest()[:12]
+    path = "/".join(
+        (
+            pelicanobj.settings.get("THEME_STATIC_DIR", "theme"),
+            "js",
+            "mathjax_pelican.%s.js" % fingerprint,
+        )
+    )
+
+    write_mathjax_script.path = path
+    write_mathjax_script.mathjax_script = mathjax_script
+
+    # The theme includes the file once per page, relative to its SITEURL, so
+    # that it is found wherever the site is served from
+    pelicanobj.settings["MATH_JAX_SCRIPT"] = path
+
+
+def markdown_extension_source():
+    """Return the source of the Markdown extension, whose output is cached."""
+    filename = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        "pelican_mathjax_markdown_extension.py",
+    )
+    with open(filename, "rb") as source:
+        return source.read()
+
+
+def mathjax_script_tag(mathjax_script):
+    """Return the HTML tag adding the MathJax script to a page."""
+    return "<script type='text/javascript'>%s</script>" % mathjax_script
+
+
+def profiled(phase, content=None):
+    """Time the body of the with statement as a phase of the build profile.
+
+    Does nothing unless profiling is enabled.
+    """
+    if profiled.profile is None:
+        return contextlib.nullcontext()
+    return profiled.profile.timed(
+        phase, None if content is None else content.source_path
+    )
+
+
+profiled.profile = None
+
+
+def attribute_markdown_timings(content):
+    """Attribute the time spent converting Markdown to the content just read."""
+    if profiled.profile is not None:
+        profiled.profile.attribute_pending(content.source_path)
+
+
+def write_profile_report(pelicanobj):
+    """Write the build profile into the output directory."""
+    if profiled.profile is None:
+        return
+
+    filename = profiled.profile.write(pelicanobj.output_path)
+    logger.info("render_math: profile written to %s", filename)
+
+
+def write_mathjax_script(pelicanobj):
+    """Write the MathJax script to its static file in the output directory."""
+    if write_mathjax_script.path is None:
+        return
+
+    filename = os.path.join(pelicanobj.output_path, write_mathjax_script.path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w", encoding="utf-8") as script_file:
+        script_file.write(write_mathjax_script.mathjax_script)
 
 
 def mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings):
@@ -293,14 +518,16 @@ def mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings):
 
     # Instantiate markdown extension and append it to the current extensions
     try:
+        extension = PelicanMathJaxExtension(config)
         if isinstance(
             pelicanobj.settings.get("MD_EXTENSIONS"), list
         ):  # pelican 3.6.3 and earlier
-            pelicanobj.settings["MD_EXTENSIONS"].append(PelicanMathJaxExtension(config))
+            pelicanobj.settings["MD_EXTENSIONS"].append(extension)
         else:
             pelicanobj.settings["MARKDOWN"].setdefault("extensions", []).append(
-                PelicanMathJaxExtension(config)
+                extension
             )
+        mathjax_for_markdown.extension = extension
     except:  # NOQA: E722
         sys.excepthook(*sys.exc_info())
         sys.stderr.write(
@@ -319,48 +546,271 @@ def mathjax_for_rst(pelicanobj, mathjax_script, mathjax_settings):
     rst_add_mathjax.mathjax_script = mathjax_script
 
 
+def mathjax_for_prerender(mathjax_settings):
+    """Set up rendering of math at build time, if a renderer is configured."""
+    prerender_math.renderer = mathjax_settings["renderer"]
+    prerender_math.cache = None
+
+    if prerender_math.renderer is None:
+        return
+
+    prerender_math.cache = RenderCache(
+        mathjax_settings["cache_path"], settings_fingerprint(mathjax_settings)
+    )
+
+    # Math rendered at build time does not need MathJax in the browser
+    mathjax_settings["auto_insert"] = False
+
+
 def pelican_init(pelicanobj):
     """Load the MathJax script according to the settings.
 
     Instantiate the Python-Markdown extension, passing in the MathJax
     script as config parameter.
     """
+    start = time.perf_counter()
+
     # Process settings, and set global var
     mathjax_settings = process_settings(pelicanobj)
 
+    # Optionally profile the plugin for this build
+    profiled.profile = None
+    if mathjax_settings["profile"]:
+        profiled.profile = BuildProfile(pelicanobj.settings.get("PATH", ""))
+
     # Generate mathjax script
     mathjax_script = process_mathjax_script(mathjax_settings)
 
+    # Configure rendering of math at build time
+    mathjax_for_prerender(mathjax_settings)
+
+    # Optionally write the script to a shared static file, included by the
+    # theme, instead of inlining it in the content
+    write_mathjax_script.path = None
+    pelicanobj.settings["MATH_JAX_SCRIPT"] = None
+    if mathjax_settings["external_script"] and mathjax_settings["auto_insert"]:
+        mathjax_script_file(pelicanobj, mathjax_script)
+        mathjax_settings["auto_insert"] = False
+
     # Configure Typogrify
     configure_typogrify(pelicanobj, mathjax_settings)
 
     # Configure Mathjax For Markdown
+    mathjax_for_markdown.extension = None
     if PelicanMathJaxExtension:
         mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings)
+        if mathjax_for_markdown.extension is not None:
+            mathjax_for_markdown.extension.profile = profiled.profile
 
     # Configure Mathjax For RST
     mathjax_for_rst(pelicanobj, mathjax_script, mathjax_settings)
+    if prerender_math.renderer is not None or write_mathjax_script.path:
+        rst_add_mathjax.mathjax_script = None
+
+    # Set the number of worker processes used once all content is read
+    process_rst_and_summaries.workers = mathjax_settings["workers"]
+
+    # The settings cover whether the script is inserted, the tag the script
+    # itself, and the source of the Markdown extension how math is output
+    # while reading
+    fingerprint = hashlib.sha256(settings_fingerprint(mathjax_settings).encode("utf-8"))
+    fingerprint.update(mathjax_script_tag(mathjax_script).encode("utf-8"))
+    fingerprint.update(markdown_extension_source())
+    fingerprint = fingerprint.hexdigest()
+
+    # Do not load the reader cache if it was written with other settings
+    process_rst_and_summaries.stamp = None
+    if pelicanobj.settings.get("CACHE_CONTENT"):
+        process_rst_and_summaries.stamp = ReaderCacheStamp(
+            pelicanobj.settings, fingerprint
+        )
+        process_rst_and_summaries.stamp.check()
+
+    # Set up the persistent cache of processed content
+    process_rst_and_summaries.cache = None
+    if pelicanobj.settings.get("CACHE_CONTENT") or pelicanobj.settings.get(
+        "LOAD_CONTENT_CACHE"
+    ):
+        process_rst_and_summaries.cache = ProcessedContentCache(
+            pelicanobj.settings, fingerprint
+        )
 
-    # Set process_summary's mathjax_script variable
+    # Set process_summary's mathjax_script variable. Summaries are still fixed
+    # when math is rendered at build time, or when the theme includes the
+    # script, but without adding the script.
     process_summary.mathjax_script = None
     if mathjax_settings["process_summary"]:
-        process_summary.mathjax_script = mathjax_script
+        process_summary.mathjax_script = (
+            mathjax_script
+            if prerender_math.renderer is None and not write_mathjax_script.path
+            else ""
+        )
 
+    if profiled.profile is not None:
+        profiled.profile.record("pelican_init", time.perf_counter() - start)
 
-def rst_add_mathjax(content):
-    """Add MathJax script for reStructuredText."""
+
+def is_rst(content):
+    """Tell whether the content was read from a reStructuredText file."""
     # .rst is the only valid extension for reStructuredText files
     _, ext = os.path.splitext(os.path.basename(content.source_path))
-    if ext != ".rst":
+    return ext == ".rst"
+
+
+def is_markdown(content):
+    """Tell whether the content was read from a Markdown file."""
+    _, ext = os.path.splitext(content.source_path)
+    return ext[1:] in MarkdownReader.file_extensions
+
+
+def has_math(content):
+    """Tell whether the content contains any math element.
+
+    The math index recorded when the content was read answers this without
+    searching the HTML again.
+    """
+    indexed = getattr(content, "_math_texts", None)
+    if indexed is not None:
+        return bool(indexed)
+
+    # note that RST hardwires mathjax to be class "math"
+    return 'class="math"' in content._content
+
+
+def rst_add_mathjax(content):
+    """Add MathJax script for reStructuredText."""
+    if not is_rst(content):
+        return
+
+    # No script is needed when math is rendered at build time, or when the
+    # theme includes it
+    if rst_add_mathjax.mathjax_script is None:
         return
 
     # If math class is present in text, add the javascript
-    # note that RST hardwires mathjax to be class "math"
-    if 'class="math"' in content._content:
-        content._content += (
-            "<script type='text/javascript'>%s</script>"
-            % rst_add_mathjax.mathjax_script
-        )
+    if has_math(content):
+        content._content += mathjax_script_tag(rst_add_mathjax.mathjax_script)
+
+
+def prerender_math(content):
+    """Render the math of the content and of its summary at build time."""
+    if prerender_math.renderer is None:
+        return
+
+    renderer, cache = prerender_math.renderer, prerender_math.cache
+
+    # The summary is derived from the content, so grab it while it still
+    # holds the TeX source
+    summary = content.summary
+    content._content = prerender_html(content._content, renderer, cache)
+    if summary and 'class="math"' in summary:
+        set_summary(content, prerender_html(summary, renderer, cache))
+
+
+def process_content(content, summary=True):
+    """Apply MathJax to a single article or page.
+
+    Add the MathJax script to reStructuredText, optionally fix truncated
+    formulae in the summary, and render math at build time if configured.
+    """
+    with profiled("rst_add_mathjax", content):
+        rst_add_mathjax(content)
+    # optionally fix truncated formulae in summaries.
+    if summary and process_summary.mathjax_script is not None:
+        with profiled("process_summary", content):
+            process_summary(content)
+    if prerender_math.renderer is not None:
+        with profiled("prerender_math", content):
+            prerender_math(content)
+
+
+class ContentProxy:
+    """Picklable stand-in for an article or page, processed in a worker process.
+
+    Only the attributes used by process_content are carried over.
+    """
+
+    def __init__(self, content, summary):
+        self.source_path = content.source_path
+        self._content = content._content
+        self._math_texts = getattr(content, "_math_texts", None)
+        self.metadata = {}
+
+        # The summary is computed from the content by Pelican, which needs the
+        # whole site context, so it is computed up front
+        self.initial_summary = None
+        if summary or prerender_math.renderer is not None:
+            self.initial_summary = content.summary
+
+    def get_summary(self, siteurl):
+        return self.metadata.get("summary", self.initial_summary)
+
+    @property
+    def summary(self):
+        return self.get_summary(None)
+
+
+def plugin_state():
+    """Return the state set up by pelican_init, as needed by worker processes."""
+    return {
+        "rst_mathjax_script": rst_add_mathjax.mathjax_script,
+        "summary_mathjax_script": process_summary.mathjax_script,
+        "renderer": prerender_math.renderer,
+        "cache": prerender_math.cache,
+        "profile": profiled.profile is not None,
+    }
+
+
+def restore_plugin_state(state):
+    """Restore the state of pelican_init in a worker process."""
+    rst_add_mathjax.mathjax_script = state["rst_mathjax_script"]
+    process_summary.mathjax_script = state["summary_mathjax_script"]
+    prerender_math.renderer = state["renderer"]
+    prerender_math.cache = state["cache"]
+    profiled.profile = BuildProfile() if state["profile"] else None
+
+
+def process_content_proxy(job):
+    """Process a content proxy in a worker process and return the results."""
+    proxy, summary = job
+    cache = prerender_math.cache
+    if cache is not None:
+        cache.used.clear()
+    process_content(proxy, summary)
+
+    timings = None
+    if profiled.profile is not None:
+        timings = profiled.profile.pop_content(proxy.source_path)
+
+    # The parent process prunes the formulas no worker used
+    used = cache.used if cache is not None else set()
+
+    return proxy._content, proxy.metadata.get("summary"), timings, used
+
+
+def process_contents_in_parallel(jobs, workers):
+    """Process the (content, summary) jobs over a pool of worker processes.
+
+    Results are applied back to the content objects in the order of the jobs,
+    so the outcome does not depend on which worker finishes first.
+    """
+    proxies = [(ContentProxy(content, summary), summary) for content, summary in jobs]
+    results = process_map(
+        process_content_proxy,
+        proxies,
+        workers,
+        initializer=restore_plugin_state,
+        initargs=(plugin_state(),),
+    )
+
+    for (content, _), (processed_content, summary, timings, used) in zip(jobs, results):
+        content._content = processed_content
+        if summary is not None:
+            set_summary(content, summary)
+        if timings:
+            profiled.profile.merge(content.source_path, timings)
+        if used:
+            prerender_math.cache.used.update(used)
 
 
 def process_rst_and_summaries(content_generators):
@@ -378,24 +828,153 @@ def process_rst_and_summaries(content_generators):
 
     Also process summaries if present (only applies to articles)
     and user wants summaries processed (via user settings)
+
+    Finally, if a renderer is configured, render the math of all content at
+    build time.
+
+    If more than one worker is configured, the content is processed over a pool
+    of worker processes.
+
+    If Pelican's content cache is enabled, content whose source, reader output
+    and settings did not change since the previous build is restored from the
+    cache instead of being processed again.
     """
+    start = time.perf_counter()
+
+    # Pairs of content and whether its summary should be processed
+    jobs = []
     for generator in content_generators:
         if isinstance(generator, generators.ArticlesGenerator):
             for article in (
                 generator.articles + generator.translations + generator.drafts
             ):
-                rst_add_mathjax(article)
-                # optionally fix truncated formulae in summaries.
-                if process_summary.mathjax_script is not None:
-                    process_summary(article)
+                jobs.append((article, True))
         elif isinstance(generator, generators.PagesGenerator):
-            for page in generator.pages:
-                rst_add_mathjax(page)
-            for page in generator.hidden_pages:
-                rst_add_mathjax(page)
+            for page in generator.pages + generator.hidden_pages:
+                jobs.append((page, False))
+
+    report_math_free_contents(jobs)
+
+    # Tell the theme which pages include the shared MathJax script
+    if write_mathjax_script.path:
+        for content, _ in jobs:
+            content.has_math = has_math(content)
+
+    cache = process_rst_and_summaries.cache
+    if cache is not None:
+        cache.hits = cache.misses = 0
+        jobs = restore_cached_contents(cache, jobs)
+
+    workers = process_rst_and_summaries.workers
+    if workers > 1 and not picklable(plugin_state()):
+        logger.warning(
+            "render_math: the renderer cannot be sent to worker processes, "
+            "content is processed in the build process"
+        )
+        workers = 1
+    if workers > 1 and jobs:
+        process_contents_in_parallel(jobs, workers)
+    else:
+        for content, summary in jobs:
+            process_content(content, summary)
+
+    stamp = process_rst_and_summaries.stamp
+    if stamp is not None:
+        stamp.save()
+        process_rst_and_summaries.stamp = None
+
+    if cache is not None:
+        for content, _ in jobs:
+            cache.put(content, content._render_math_fingerprint)
+        cache.save_cache()
+        logger.debug(
+            "render_math: %d contents restored from cache, %d processed",
+            cache.hits,
+            cache.misses,
+        )
+
+    if prerender_math.cache is not None:
+        pruned = prerender_math.cache.prune()
+        logger.debug("render_math: %d unused rendered formulas pruned", pruned)
+
+    profile = profiled.profile
+    if profile is not None:
+        profile.record("process_rst_and_summaries", time.perf_counter() - start)
+        profile.counters["workers"] = workers
+        profile.counters["mathjax_script_cache_hits"] = process_mathjax_script.hits
+        profile.counters["mathjax_script_cache_misses"] = process_mathjax_script.misses
+        if cache is not None:
+            profile.counters["content_cache_hits"] = cache.hits
+            profile.counters["content_cache_misses"] = cache.misses
+
+
+def report_math_free_contents(jobs):
+    """Log how many documents were found to contain no math, and reset the counts.
+
+    Math processing is skipped for such Markdown documents while they are read,
+    and reStructuredText documents without math get no MathJax script. The
+    documents are counted from the contents, so that the counts do not depend on
+    how many of them Pelican's cache spared reading again.
+    """
+    md_contents = [content for content, _ in jobs if is_markdown(content)]
+    md_skipped = sum(1 for content in md_contents if not has_math(content))
+    rst_contents = [content for content, _ in jobs if is_rst(content)]
+    rst_skipped = sum(1 for content in rst_contents if not has_math(content))
+
+    # Documents parsed by the Markdown extension in this build, i.e. not
+    # restored from Pelican's cache
+    md_parsed = md_parse_skipped = 0
+    extension = mathjax_for_markdown.extension
+    if extension is not None:
+        md_parsed = extension.stats["documents"]
+        md_parse_skipped = extension.stats["skipped"]
+        extension.stats.clear()
+
+    if profiled.profile is not None:
+        profiled.profile.counters.update(
+            markdown_documents=len(md_contents),
+            markdown_math_free=md_skipped,
+            markdown_parsed=md_parsed,
+            markdown_parsed_math_free=md_parse_skipped,
+            rst_documents=len(rst_contents),
+            rst_math_free=rst_skipped,
+        )
+
+    logger.info(
+        "render_math: no math in %d of %d Markdown and %d of %d"
+        " reStructuredText documents",
+        md_skipped,
+        len(md_contents),
+        rst_skipped,
+        len(rst_contents),
+    )
+
+
+def restore_cached_contents(cache, jobs):
+    """Restore the content found in the cache, and return the remaining jobs."""
+    remaining_jobs = []
+    for content, summary in jobs:
+        fingerprint = cache.fingerprint(content)
+        cached = cache.get(content, fingerprint)
+        if cached is None:
+            content._render_math_fingerprint = fingerprint
+            remaining_jobs.append((content, summary))
+            continue
+
+        if prerender_math.cache is not None:
+            prerender_math.cache.mark_used(content._content)
+        content._content, cached_summary = cached
+        if cached_summary is not None:
+            set_summary(content, cached_summary)
+
+    return remaining_jobs
 
 
 def register():
     """Register the plugin."""
     signals.initialized.connect(pelican_init)
+    signals.content_object_init.connect(index_math)
+    signals.content_object_init.connect(attribute_markdown_timings)
     signals.all_generators_finalized.connect(process_rst_and_summaries)
+    signals.finalized.connect(write_mathjax_script)
+    signals.finalized.connect(write_profile_report)
@@ -4,6 +4,7 @@ An extension for the Python-Markdown module that enables Pelican to process Math
 This extension enables Pelican to use Mathjax as a first-class citizen.
 """
 
+from collections import Counter
 from xml.etree.ElementTree import Element
 
 import markdown
@@ -11,7 +12,10 @@ from markdown.util import AtomicString
 
 
 class PelicanMathJaxPattern(markdown.inlinepatterns.Pattern):
-    """Inline markdown processing that matches MathJax."""
+    """Inline markdown processing that matches MathJax.
+
+    Superseded by PelicanMathJaxInlineProcessor, kept for backward compatibility.
+    """
 
     def __init__(self, pelican_mathjax_extension, tag, pattern):
         super().__init__(pattern)
@@ -33,17 +37,157 @@ class PelicanMathJaxPattern(markdown.inlinepatterns.Pattern):
         return node
 
 
+class PelicanMathJaxInlineProcessor(markdown.inlinepatterns.InlineProcessor):
+    r"""Inline markdown processing that matches displayed and inline MathJax.
+
+    All delimiters ($$, $ and \begin{...}) are found by a single regex, and the
+    closing delimiters are then located with plain string searches, so the text
+    is scanned linearly and unbalanced dollars cannot cause catastrophic
+    backtracking. As with the former separate patterns, displayed math takes
+    precedence over inline math, and inline math cannot end with whitespace.
+    """
+
+    DELIMITER_RE = r"\$\$|\$|\\begin\{(?P<env>[^}]+)\}"
+
+    def __init__(self, pelican_mathjax_extension):
+        super().__init__(self.DELIMITER_RE)
+        self.math_tag_class = pelican_mathjax_extension.getConfig("math_tag_class")
+        self.pelican_mathjax_extension = pelican_mathjax_extension
+
+        # Positions from which no closing delimiter is left in the data being
+        # processed, so that unbalanced delimiters are only searched for once
+        self._data = None
+        self._missing_display_end = {}
+        self._missing_inline_end = None
+
+    def display_end(self, data, m):
+        """Return the position and suffix closing the displayed math opened by m.
+
+        Return None if m does not open displayed math.
+        """
+        prefix = m.group(0)
+        if prefix == "$":
+            return None
+
+        suffixes = (prefix,)
+        if m.group("env") is not None:
+            suffixes = (prefix, "\\end{%s}" % m.group("env"))
+
+        # Math must not be empty
+        start = m.end(0) + 1
+        if start >= self._missing_display_end.get(suffixes, len(data) + 1):
+            return None
+
+        ends = [(data.find(suffix, start), suffix) for suffix in suffixes]
+        ends = [end for end in ends if end[0] != -1]
+        if not ends:
+            self._missing_display_end[suffixes] = start
+            return None
+
+        return min(ends)
+
+    def inline_end(self, data, start):
+        """Return the position of the dollar closing inline math opened at start.
+
+        Return None if the inline math is not closed before displayed math.
+        """
+        if self._missing_inline_end is not None and start >= self._missing_inline_end:
+            return None
+
+        pos = start + 1
+        while True:
+            m = self.compiled_re.search(data, pos)
+            if m is None:
+                self._missing_inline_end = start
+                return None
+
+            # Displayed math takes precedence over inline math
+            if self.display_end(data, m) is not None:
+                return None
+
+            end = m.start(0)
+            if m.group(0)[0] == "$" and end > start + 1 and not data[end - 1].isspace():
+                return end
+
+            pos = end + 1
+
+    def handleMatch(self, m, data):
+        if data is not self._data:
+            self._data = data
+            self._missing_display_end = {}
+            self._missing_inline_end = None
+
+        start = m.start(0)
+        display_end = self.display_end(data, m)
+
+        if display_end is not None:
+            end, suffix = display_end
+            node = Element("div")
+            text = m.group(0) + data[m.end(0) : end] + suffix
+            end += len(suffix)
+        elif m.group(0)[0] == "$":
+            end = self.inline_end(data, start)
+            if end is None:
+                return None, None, None
+
+            node = Element("span")
+            text = "\\(" + data[start + 1 : end] + "\\)"
+            end += 1
+        else:
+            return None, None, None
+
+        node.set("class", self.math_tag_class)
+        node.text = AtomicString(text)
+
+        # If mathjax was successfully matched, then JavaScript needs to be added
+        # for rendering. The boolean below indicates this
+        self.pelican_mathjax_extension.mathjax_needed = True
+        return node, start, end
+
+
+class PelicanMathJaxPrefilter(markdown.preprocessors.Preprocessor):
+    """Skip all math processing for documents without any math delimiter.
+
+    Most documents contain no math at all. For those, the math inline processor
+    and treeprocessors are removed from the Markdown instance before the
+    document is processed, and put back for the next document which needs them.
+    """
+
+    def __init__(self, pelican_mathjax_extension, md, math_processors):
+        super().__init__(md)
+        self.pelican_mathjax_extension = pelican_mathjax_extension
+        self.math_processors = math_processors
+
+    def run(self, lines):
+        math_possible = any("$" in line or "\\begin{" in line for line in lines)
+
+        stats = self.pelican_mathjax_extension.stats
+        stats["documents"] += 1
+        if not math_possible:
+            stats["skipped"] += 1
+
+        for registry, processor, name, priority in self.math_processors:
+            if math_possible and name not in registry:
+                registry.register(processor, name, priority)
+            elif not math_possible and name in registry:
+                registry.deregister(name)
+
+        return lines
+
+
 class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
     """Correct invalid HTML when a <div> is placed inside a <p> for displayed math."""
 
     def __init__(self, pelican_mathjax_extension):
         self.pelican_mathjax_extension = pelican_mathjax_extension
 
-    def correct_html(self, root, children, div_math, insert_idx, text):
+    def correct_html(self, children, div_math, text):
         """Separate out <div class="math"> from the parent tag <p>.
 
-        Anything in-between is put into its own parent <p> tag.
+        Anything in-between is put into its own parent <p> tag. Return the list
+        of elements replacing the parent tag.
         """
+        corrected = []
         current_idx = 0
 
         for idx in div_math:
@@ -53,13 +197,11 @@ class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
 
             # Test to ensure that empty <p> is not inserted
             if len(el) != 0 or (el.text and not el.text.isspace()):
-                root.insert(insert_idx, el)
-                insert_idx += 1
+                corrected.append(el)
 
             text = children[idx].tail
             children[idx].tail = None
-            root.insert(insert_idx, children[idx])
-            insert_idx += 1
+            corrected.append(children[idx])
             current_idx = idx + 1
 
         el = Element("p")
@@ -67,32 +209,39 @@ class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
         el.extend(children[current_idx:])
 
         if len(el) != 0 or (el.text and not el.text.isspace()):
-            root.insert(insert_idx, el)
+            corrected.append(el)
+
+        return corrected
 
     def run(self, root):
         """Search for <div class="math"> that are children in <p> tags.
 
-        And correct the invalid HTML that results.
+        And correct the invalid HTML that results. The children of the root are
+        visited once, and the root is rebuilt at the end only if needed.
         """
         math_tag_class = self.pelican_mathjax_extension.getConfig("math_tag_class")
 
+        corrected = []
+        needs_correction = False
+
         for parent in root:
-            div_math = []
             children = list(parent)
-
-            for div in parent.findall("div"):
-                if div.get("class") == math_tag_class:
-                    div_math.append(children.index(div))
+            div_math = [
+                idx
+                for idx, child in enumerate(children)
+                if child.tag == "div" and child.get("class") == math_tag_class
+            ]
 
             # Do not process further if no displayed math has been found
             if not div_math:
+                corrected.append(parent)
                 continue
 
-            insert_idx = list(root).index(parent)
-            self.correct_html(root, children, div_math, insert_idx, parent.text)
-            root.remove(
-                parent
-            )  # Parent must be removed last for correct insertion index
+            corrected.extend(self.correct_html(children, div_math, parent.text))
+            needs_correction = True
+
+        if needs_correction:
+            root[:] = corrected
 
         return root
 
@@ -158,37 +307,56 @@ class PelicanMathJaxExtension(markdown.Extension):
         # needs to be injected into a document
         self.mathjax_needed = False
 
-    def extendMarkdown(self, md):
-        # Regex to detect mathjax
-        mathjax_inline_regex = r"(?P<prefix>\$)(?P<math>.+?)(?P<suffix>(?<!\s)\2)"
-        mathjax_display_regex = (
-            r"(?P<prefix>\$\$|\\begin\{(.+?)\})(?P<math>.+?)(?P<suffix>\2|\\end\{\3\})"
-        )
+        # Number of documents processed, and skipped by the prefilter
+        self.stats = Counter()
 
+        # Build profile timing the processors, if profiling is enabled
+        self.profile = None
+
+    def extendMarkdown(self, md):
         # Process mathjax before escapes are processed since escape processing will
-        # interfere with mathjax. The order in which the displayed and inlined math
-        # is registered below matters: we should have higher priority than 'escape',
+        # interfere with mathjax: we should have higher priority than 'escape',
         # which has 180.
-        md.inlinePatterns.register(
-            PelicanMathJaxPattern(self, "div", mathjax_display_regex),
-            "mathjax_displayed",
-            186,
-        )
-        md.inlinePatterns.register(
-            PelicanMathJaxPattern(self, "span", mathjax_inline_regex),
-            "mathjax_inlined",
-            185,
-        )
+        math_processors = [
+            (md.inlinePatterns, PelicanMathJaxInlineProcessor(self), "mathjax", 186)
+        ]
 
         # Correct the invalid HTML that results from the displayed math
         # (<div> tag within a <p> tag)
-        md.treeprocessors.register(
-            PelicanMathJaxCorrectDisplayMath(self), "mathjax_correctdisplayedmath", 15
+        math_processors.append(
+            (
+                md.treeprocessors,
+                PelicanMathJaxCorrectDisplayMath(self),
+                "mathjax_correctdisplayedmath",
+                15,
+            )
         )
 
         # If necessary, add the JavaScript Mathjax library to the document. This must
         # be last in the ordered dict (hence it is given the position '_end')
         if self.getConfig("auto_insert"):
-            md.treeprocessors.register(
-                PelicanMathJaxAddJavaScript(self), "mathjax_addjavascript", 0
+            math_processors.append(
+                (
+                    md.treeprocessors,
+                    PelicanMathJaxAddJavaScript(self),
+                    "mathjax_addjavascript",
+                    0,
+                )
             )
+
+        for registry, processor, name, priority in math_processors:
+            registry.register(processor, name, priority)
+
+        # Skip the processors above for documents without math
+        prefilter = PelicanMathJaxPrefilter(self, md, math_processors)
+        md.preprocessors.register(prefilter, "mathjax_prefilter", 25)
+
+        if self.profile is not None:
+            self.profile.instrument(prefilter, "run", "markdown.mathjax_prefilter")
+            for _, processor, name, _ in math_processors:
+                method = (
+                    "handleMatch"
+                    if isinstance(processor, markdown.inlinepatterns.InlineProcessor)
+                    else "run"
+                )
+                self.profile.instrument(processor, method, "markdown." + name)
@@ -0,0 +1,158 @@
+"""Build-time rendering of math for the Render Math plugin.
+
+When a renderer is configured, the TeX inside every ``<span class="math">`` and
+``<div class="math">`` element is turned into static HTML (or SVG) while the site
+is built, so readers' browsers no longer need to typeset it with MathJax.
+
+Rendered formulas are kept in a content-addressed on-disk cache, keyed by the
+TeX source and the MathJax settings, so unchanged formulas are never rendered
+twice across builds. Formulas no longer found in the content are deleted from
+the cache at the end of each build.
+
+A renderer is any callable taking the TeX source (without delimiters) and a
+boolean telling whether the math is displayed, and returning an HTML string.
+"""
+
+import hashlib
+import html
+import json
+import re
+from subprocess import PIPE, run
+
+from build_support.store import ContentStore
+
+# Matches the math elements produced by the Markdown extension and by docutils
+# when its ``math_output`` is set to MathJax.
+MATH_ELEMENT_RE = re.compile(
+    r'<(?P<tag>span|div) class="math">(?P<tex>.*?)</(?P=tag)>', re.DOTALL
+)
+
+# Delimiters wrapping the TeX source inside math elements. Environments such as
+# \begin{equation*}...\end{equation*} are kept as they are.
+MATH_DELIMITERS = (("\\(", "\\)"), ("\\[", "\\]"), ("$$", "$$"))
+
+
+def strip_delimiters(tex):
+    """Remove the MathJax delimiters surrounding the TeX source."""
+    tex = tex.strip()
+    for prefix, suffix in MATH_DELIMITERS:
+        if tex.startswith(prefix) and tex.endswith(suffix):
+            return tex[len(prefix) : -len(suffix)].strip()
+    return tex
+
+
+def passthrough_renderer(tex, display):
+    """Render math as its escaped TeX source.
+
+    This is a local stand-in for a real renderer: it needs no external tools,
+    so builds work offline and in tests.
+    """
+    return '<code class="tex">%s</code>' % html.escape(tex)
+
+
+class CommandRenderer:
+    """Render math by piping the TeX source through an external command.
+
+    For example, ``CommandRenderer(["tex2svg"], inline_args=["--inline"])`` uses
+    the ``tex2svg`` tool of mathjax-full to produce SVG.
+    """
+
+    def __init__(self, args, inline_args=()):
+        self.args = list(args)
+        self.inline_args = list(inline_args)
+
+    def __call__(self, tex, display):
+        args = self.args if display else self.args + self.inline_args
+        result = run(args, input=tex, stdout=PIPE, check=True, text=True)
+        return result.stdout.strip()
+
+
+# Renderers which can be selected by name in the MATH_JAX settings
+RENDERERS = {
+    "passthrough": passthrough_renderer,
+}
+
+
+def renderer_name(renderer):
+    """Return a stable name identifying the renderer across builds."""
+    if renderer is None:
+        return ""
+    if isinstance(renderer, CommandRenderer):
+        return json.dumps([renderer.args, renderer.inline_args])
+    return f"{renderer.__module__}.{renderer.__qualname__}"
+
+
+# Settings which only change how the build runs, or how the MathJax script is
+# loaded, and not how math is rendered
+BUILD_SETTINGS = (
+    "renderer",
+    "cache_path",
+    "profile",
+    "workers",
+    "loading",
+    "lazy_margin",
+    "external_script",
+)
+
+
+def settings_fingerprint(mathjax_settings):
+    """Hash the settings which influence how math is rendered."""
+    settings = {
+        key: value
+        for key, value in mathjax_settings.items()
+        if key not in BUILD_SETTINGS
+    }
+    settings["renderer"] = renderer_name(mathjax_settings["renderer"])
+    serialized = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class RenderCache(ContentStore):
+    """Content-addressed on-disk store of rendered formulas."""
+
+    def __init__(self, path, fingerprint):
+        super().__init__(path, ".html")
+        self.fingerprint = fingerprint
+
+    def key(self, tex, display):
+        return super().key(self.fingerprint, "display" if display else "inline", tex)
+
+    def mark_used(self, text):
+        """Record that the formulas of the HTML text are still in use.
+
+        Content restored from the cache of processed content still holds the
+        formulas it was rendered from, which must not be pruned.
+        """
+        for match in MATH_ELEMENT_RE.finditer(text):
+            tex = strip_delimiters(html.unescape(match.group("tex")))
+            self.used.add(self.key(tex, match.group("tag") == "div"))
+
+
+def render_formula(tex, display, renderer, cache=None):
+    """Render a single formula, going through the cache if one is given."""
+    if cache is None:
+        return renderer(tex, display)
+
+    key = cache.key(tex, display)
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = renderer(tex, display)
+        cache.put(key, rendered)
+    return rendered
+
+
+def prerender_html(text, renderer, cache=None):
+    """Replace every math element of the HTML text by its rendered form.
+
+    The rendered math keeps its wrapping element, marked with an additional
+    ``rendered`` class so that it is not picked up again.
+    """
+
+    def replace(match):
+        tag = match.group("tag")
+        display = tag == "div"
+        tex = strip_delimiters(html.unescape(match.group("tex")))
+        rendered = render_formula(tex, display, renderer, cache)
+        return f'<{tag} class="math rendered">{rendered}</{tag}>'
+
+    return MATH_ELEMENT_RE.sub(replace, text)
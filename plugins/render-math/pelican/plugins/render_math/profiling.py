@@ -0,0 +1,116 @@
+"""Opt-in profiling of the Render Math plugin.
+
+When profiling is enabled, the wall time and number of calls of each phase of
+the plugin are recorded, both for the whole build and for every article or page,
+and written as a JSON report into the output directory at the end of the build,
+so that the time the plugin adds to builds can be tracked between builds.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+from time import perf_counter
+
+# Name of the report written into the output directory
+REPORT_FILENAME = "render_math_profile.json"
+
+
+def add_timing(timings, phase, seconds, calls=1):
+    """Add calls and time spent to the timings of a phase."""
+    timing = timings.setdefault(phase, {"calls": 0, "seconds": 0.0})
+    timing["calls"] += calls
+    timing["seconds"] += seconds
+
+
+class BuildProfile:
+    """Wall time and call counts of the plugin's phases, in total and per content.
+
+    Markdown is converted before the content object it belongs to exists, so the
+    timings of the Markdown processors are kept pending until the content is
+    created, then attributed to it.
+    """
+
+    def __init__(self, base_path=""):
+        self.base_path = base_path
+        self.phases = {}
+        self.contents = {}
+        self.pending = {}
+        self.counters = {}
+
+    def content_key(self, source_path):
+        if self.base_path and os.path.isabs(source_path):
+            return os.path.relpath(source_path, self.base_path)
+        return source_path
+
+    def record(self, phase, seconds, source_path=None, calls=1):
+        """Record a call of the phase, for the given content if any."""
+        add_timing(self.phases, phase, seconds, calls)
+        if source_path is not None:
+            timings = self.contents.setdefault(self.content_key(source_path), {})
+            add_timing(timings, phase, seconds, calls)
+
+    def record_pending(self, phase, seconds):
+        """Record a call of the phase for the content being read."""
+        add_timing(self.phases, phase, seconds)
+        add_timing(self.pending, phase, seconds)
+
+    def attribute_pending(self, source_path):
+        """Attribute the pending timings to the content which was just read."""
+        if not self.pending:
+            return
+        self.merge(source_path, self.pending, totals=False)
+        self.pending = {}
+
+    def merge(self, source_path, timings, totals=True):
+        """Merge the timings of a content, recorded by another profile."""
+        for phase, timing in timings.items():
+            if totals:
+                add_timing(self.phases, phase, timing["seconds"], timing["calls"])
+            add_timing(
+                self.contents.setdefault(self.content_key(source_path), {}),
+                phase,
+                timing["seconds"],
+                timing["calls"],
+            )
+
+    def pop_content(self, source_path):
+        """Remove and return the timings of a content."""
+        return self.contents.pop(self.content_key(source_path), {})
+
+    @contextmanager
+    def timed(self, phase, source_path=None):
+        """Time the body of the with statement as a call of the phase."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, perf_counter() - start, source_path)
+
+    def instrument(self, obj, name, phase):
+        """Time every call of the method of the object as a pending phase."""
+        method = getattr(obj, name)
+
+        def timed_method(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record_pending(phase, perf_counter() - start)
+
+        setattr(obj, name, timed_method)
+
+    def report(self):
+        """Return the report as a JSON-serializable dictionary."""
+        return {
+            "phases": self.phases,
+            "contents": self.contents,
+            "counters": self.counters,
+        }
+
+    def write(self, output_path):
+        """Write the report into the output directory and return its path."""
+        filename = os.path.join(output_path, REPORT_FILENAME)
+        os.makedirs(output_path, exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as report:
+            json.dump(self.report(), report, indent=2, sort_keys=True)
+        return filename
@@ -1,16 +1,81 @@
+import json
+from os import listdir, makedirs, walk
 from os.path import dirname, join
+import shutil
+import subprocess
 from tempfile import TemporaryDirectory
 
+import markdown
+
 from pelican import Pelican
 from pelican.generators import ArticlesGenerator
 from pelican.settings import configure_settings
 from pelican.tests.support import get_settings, unittest
 from pelican.writers import Writer
 
-from .math import pelican_init, process_rst_and_summaries
+from .math import (
+    index_math,
+    logger,
+    pelican_init,
+    prerender_math,
+    process_mathjax_script,
+    process_rst_and_summaries,
+    process_settings,
+    process_summary,
+    write_mathjax_script,
+    write_profile_report,
+)
+from .pelican_mathjax_markdown_extension import PelicanMathJaxExtension
+from .prerender import settings_fingerprint
 
 CUR_DIR = dirname(__file__)
 
+# Runs the MathJax script given as argument in a minimal DOM, where the script
+# loaded is a loader which only defines MathJax some time after its load event,
+# like the default MathJax source, then prints the elements typeset
+LAZY_LOADING_HARNESS = """
+const elements = [{id: 'first'}, {id: 'second'}];
+const appended = [];
+const typeset = [];
+const hooks = [];
+let observed = null;
+globalThis.window = globalThis;
+globalThis.screen = {width: 1024};
+globalThis.document = {
+    readyState: 'complete',
+    body: {appendChild: (element) => appended.push(element)},
+    getElementById: (id) => appended.find((element) => element.id === id) || null,
+    createElement: () => ({}),
+    querySelectorAll: () => elements,
+};
+globalThis.IntersectionObserver = function (callback) {
+    observed = callback;
+    this.observe = () => {};
+    this.unobserve = () => {};
+};
+const show = (element) => observed([{isIntersecting: true, target: element}]);
+
+(0, eval)(process.argv[1]);
+show(elements[0]);
+const [config, loader] = appended;
+if (loader.onload) {
+    loader.onload();
+}
+globalThis.MathJax = {
+    Hub: {
+        Config: () => {},
+        Register: {
+            StartupHook: (name, hook) => name === 'End' && hooks.push(hook),
+        },
+        Queue: (job) => typeset.push(job[2].id),
+    },
+};
+(0, eval)(config.text);
+hooks.forEach((hook) => hook());
+show(elements[1]);
+console.log(JSON.stringify({appended: appended.length, typeset: typeset}));
+"""
+
 
 class RenderMathTest(unittest.TestCase):
     def test_ok_on_shared_test_data(self):
@@ -37,6 +102,384 @@ class RenderMathTest(unittest.TestCase):
                     self.assertIn("mathjaxscript_pelican", article.content)
             generator.generate_output(Writer(tmpdirname, settings=settings))
 
+    def test_prerender_with_passthrough_renderer(self):
+        with TemporaryDirectory() as tmpdirname:
+            settings = get_settings(filenames={})
+            settings["PATH"] = join(CUR_DIR, "test_data")
+            settings["CACHE_PATH"] = join(tmpdirname, "cache")
+            settings["MATH_JAX"] = {"renderer": "passthrough"}
+            pelican_init(PelicanMock(settings))
+            generator = _build_article_generator(settings, tmpdirname)
+            process_rst_and_summaries([generator])
+
+            article = generator.articles[0]
+            self.assertNotIn("mathjaxscript_pelican", article.content)
+            self.assertNotIn('class="math"', article.content)
+            self.assertIn(
+                '<span class="math rendered"><code class="tex">A_\\text{c}',
+                article.content,
+            )
+            self.assertIn('class="math rendered"', article.summary)
+            # one cache entry per distinct formula
+            cached = [f for _, _, files in walk(settings["CACHE_PATH"]) for f in files]
+            self.assertEqual(len(cached), 3)
+
+    def test_unused_rendered_formulas_are_pruned(self):
+        with TemporaryDirectory() as tmpdirname:
+            content_path = join(tmpdirname, "content")
+            makedirs(content_path)
+            render_path = join(tmpdirname, "cache", "render_math")
+
+            hits = []
+            for formula in ("$a$ $b$", "$a$ $b$", "$a$ $c$"):
+                with open(join(content_path, "article.md"), "w") as article:
+                    article.write(f"Title: Math\nDate: 2020-01-01\n\n{formula}\n")
+                settings = get_settings(filenames={})
+                settings["PATH"] = content_path
+                settings["CACHE_PATH"] = join(tmpdirname, "cache")
+                settings["CACHE_CONTENT"] = True
+                settings["LOAD_CONTENT_CACHE"] = True
+                settings["MATH_JAX"] = {"renderer": "passthrough"}
+                pelican_init(PelicanMock(settings))
+                generator = _build_article_generator(settings, tmpdirname)
+                process_rst_and_summaries([generator])
+                hits.append(process_rst_and_summaries.cache.hits)
+
+                # Restored content keeps its formulas in the cache
+                cache = prerender_math.cache
+                cached = sorted(f for _, _, files in walk(render_path) for f in files)
+                self.assertEqual(
+                    cached,
+                    sorted(
+                        cache.key(tex, False) + ".html"
+                        for tex in formula.replace("$", "").split()
+                    ),
+                )
+
+            self.assertEqual(hits, [0, 1, 0])
+
+    def test_math_free_contents_are_counted_on_cached_rebuilds(self):
+        with TemporaryDirectory() as tmpdirname:
+            content_path = join(tmpdirname, "content")
+            makedirs(content_path)
+
+            # Pelican's cache spares reading the first articles again on the
+            # second build, they are counted all the same
+            articles = [("math.md", "$a$"), ("prose.md", "No math.")]
+            for counts in ("1 of 2", "2 of 3"):
+                for name, text in articles:
+                    with open(join(content_path, name), "w") as article:
+                        article.write(f"Title: {name}\nDate: 2020-01-01\n\n{text}\n")
+                settings = get_settings(filenames={})
+                settings["PATH"] = content_path
+                settings["CACHE_PATH"] = join(tmpdirname, "cache")
+                settings["CACHE_CONTENT"] = True
+                settings["LOAD_CONTENT_CACHE"] = True
+                settings["CHECK_MODIFIED_METHOD"] = "md5"
+                pelican_init(PelicanMock(settings))
+                generator = _build_article_generator(settings, tmpdirname)
+                with self.assertLogs(logger, level="INFO") as logs:
+                    process_rst_and_summaries([generator])
+                self.assertIn(
+                    f"render_math: no math in {counts} Markdown and 0 of 0"
+                    " reStructuredText documents",
+                    logs.output[0],
+                )
+                articles = [("more.md", "More prose.")]
+
+    def test_external_script(self):
+        with TemporaryDirectory() as tmpdirname:
+            settings = get_settings(filenames={})
+            settings["PATH"] = join(CUR_DIR, "test_data")
+            settings["MATH_JAX"] = {"external_script": True}
+            pelican_mock = PelicanMock(settings)
+            pelican_mock.output_path = tmpdirname
+            pelican_init(pelican_mock)
+            generator = _build_article_generator(settings, tmpdirname)
+            process_rst_and_summaries([generator])
+            write_mathjax_script(pelican_mock)
+
+            # The theme includes the script once per page, relative to SITEURL
+            article = generator.articles[0]
+            script_files = listdir(join(tmpdirname, "theme", "js"))
+            self.assertEqual(len(script_files), 1)
+            self.assertEqual(settings["MATH_JAX_SCRIPT"], "theme/js/" + script_files[0])
+            self.assertTrue(article.has_math)
+            self.assertNotIn("<script", article.content)
+            self.assertNotIn("<script", article.summary)
+            with open(join(tmpdirname, "theme", "js", script_files[0])) as script:
+                self.assertIn("mathjaxscript_pelican", script.read())
+
+    def test_workers_give_the_same_results(self):
+        results = []
+        with TemporaryDirectory() as tmpdirname:
+            for workers in (1, 2):
+                settings = get_settings(filenames={})
+                settings["PATH"] = join(CUR_DIR, "test_data")
+                settings["MATH_JAX"] = {"workers": workers}
+                pelican_init(PelicanMock(settings))
+                generator = _build_article_generator(settings, tmpdirname)
+                process_rst_and_summaries([generator])
+                results.append([(a.content, a.summary) for a in generator.articles])
+
+        self.assertIn("mathjaxscript_pelican", results[1][0][0])
+        self.assertEqual(results[0], results[1])
+
+    def test_unpicklable_renderer_falls_back_to_one_process(self):
+        with TemporaryDirectory() as tmpdirname:
+            settings = get_settings(filenames={})
+            settings["PATH"] = join(CUR_DIR, "test_data")
+            settings["CACHE_PATH"] = join(tmpdirname, "cache")
+            settings["MATH_JAX"] = {
+                "workers": 2,
+                "renderer": lambda tex, display: "<b>%s</b>" % tex,
+            }
+            pelican_init(PelicanMock(settings))
+            generator = _build_article_generator(settings, tmpdirname)
+            with self.assertLogs(level="WARNING"):
+                process_rst_and_summaries([generator])
+
+            self.assertIn(
+                '<span class="math rendered"><b>', generator.articles[0].content
+            )
+
+    def test_profile_report(self):
+        with TemporaryDirectory() as tmpdirname:
+            settings = get_settings(filenames={})
+            settings["PATH"] = join(CUR_DIR, "test_data")
+            settings["MATH_JAX"] = {"workers": 2, "profile": True}
+            pelican = PelicanMock(settings)
+            pelican.output_path = tmpdirname
+            pelican_init(pelican)
+            generator = _build_article_generator(settings, tmpdirname)
+            process_rst_and_summaries([generator])
+            write_profile_report(pelican)
+
+            with open(join(tmpdirname, "render_math_profile.json")) as report_file:
+                report = json.load(report_file)
+
+        articles = len(generator.articles)
+        self.assertEqual(report["phases"]["pelican_init"]["calls"], 1)
+        self.assertEqual(report["phases"]["process_summary"]["calls"], articles)
+        self.assertEqual(report["counters"]["workers"], 2)
+        for article in generator.articles:
+            timings = report["contents"][article.relative_source_path]
+            self.assertEqual(timings["rst_add_mathjax"]["calls"], 1)
+
+    def test_displayed_math_is_moved_out_of_paragraphs(self):
+        extension = PelicanMathJaxExtension(
+            {"mathjax_script": "", "math_tag_class": "math", "auto_insert": False}
+        )
+        text = "\n\n".join(
+            [
+                "Before $$a$$ between $$b$$ after",
+                "$$c$$",
+                "Plain paragraph with $d$ inline",
+            ]
+            * 2
+        )
+        expected = "\n".join(
+            [
+                "<p>Before </p>",
+                '<div class="math">$$a$$</div>',
+                "<p> between </p>",
+                '<div class="math">$$b$$</div>',
+                "<p> after</p>",
+                '<div class="math">$$c$$</div>',
+                '<p>Plain paragraph with <span class="math">\\(d\\)</span> inline</p>',
+            ]
+        )
+        html = markdown.markdown(text, extensions=[extension])
+        self.assertEqual(html.replace("\n\n", "\n"), expected + "\n" + expected)
+
+    def test_math_delimiters(self):
+        extension = PelicanMathJaxExtension(
+            {"mathjax_script": "", "math_tag_class": "math", "auto_insert": False}
+        )
+        md = markdown.Markdown(extensions=[extension])
+        cases = {
+            "$e=mc^2$": '<p><span class="math">\\(e=mc^2\\)</span></p>',
+            "$40 vs $50": "<p>$40 vs $50</p>",
+            "$a $$b$$": '<p>$a </p>\n<div class="math">$$b$$</div>',
+            "\\begin{align}x\\end{align}": '<div class="math">\\begin{align}x\\end{align}</div>',
+            "$ " * 1000 + "end": "<p>%send</p>" % ("$ " * 1000),
+        }
+        for text, expected in cases.items():
+            md.reset()
+            self.assertEqual(md.convert(text), expected)
+
+    def test_documents_without_math_skip_math_processing(self):
+        extension = PelicanMathJaxExtension(
+            {"mathjax_script": "", "math_tag_class": "math", "auto_insert": True}
+        )
+        md = markdown.Markdown(extensions=[extension])
+        cases = [
+            ("No *math* here.", "<p>No <em>math</em> here.</p>"),
+            (
+                "$e=mc^2$",
+                '<p><span class="math">\\(e=mc^2\\)</span></p>\n<script type=',
+            ),
+            ("Still no math.", "<p>Still no math.</p>"),
+        ]
+        for text, expected in cases:
+            md.reset()
+            self.assertTrue(md.convert(text).startswith(expected))
+
+        self.assertEqual(extension.stats["documents"], 3)
+        self.assertEqual(extension.stats["skipped"], 2)
+
+    def test_processed_content_is_restored_from_cache(self):
+        results = []
+        with TemporaryDirectory() as tmpdirname:
+            for _ in range(2):
+                settings = get_settings(filenames={})
+                settings["PATH"] = join(CUR_DIR, "test_data")
+                settings["CACHE_PATH"] = join(tmpdirname, "cache")
+                settings["CACHE_CONTENT"] = True
+                settings["LOAD_CONTENT_CACHE"] = True
+                pelican_init(PelicanMock(settings))
+                generator = _build_article_generator(settings, tmpdirname)
+                process_rst_and_summaries([generator])
+                results.append([(a.content, a.summary) for a in generator.articles])
+
+            cache = process_rst_and_summaries.cache
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1][0][0].count("mathjaxscript_pelican"), 2)
+
+    def test_reader_cache_is_not_loaded_when_settings_change(self):
+        with TemporaryDirectory() as tmpdirname:
+            content_path = join(tmpdirname, "content")
+            makedirs(content_path)
+            with open(join(content_path, "article.md"), "w") as article:
+                article.write("Title: Math\nDate: 2020-01-01\n\n$e=mc^2$\n")
+
+            for math_jax in ({}, {"external_script": True}):
+                settings = get_settings(filenames={})
+                settings["PATH"] = content_path
+                settings["CACHE_PATH"] = join(tmpdirname, "cache")
+                settings["CACHE_CONTENT"] = True
+                settings["LOAD_CONTENT_CACHE"] = True
+                settings["MATH_JAX"] = math_jax
+                pelican_mock = PelicanMock(settings)
+                pelican_mock.output_path = tmpdirname
+                pelican_init(pelican_mock)
+                generator = _build_article_generator(settings, tmpdirname)
+                process_rst_and_summaries([generator])
+                self.assertTrue(settings["LOAD_CONTENT_CACHE"])
+
+            article = generator.articles[0]
+            self.assertNotIn("<script", article.content)
+            self.assertTrue(article.has_math)
+
+    def test_mathjax_script_is_cached(self):
+        mathjax_settings = process_settings(PelicanMock(get_settings(filenames={})))
+        mathjax_script = process_mathjax_script(mathjax_settings)
+        hits, misses = process_mathjax_script.hits, process_mathjax_script.misses
+
+        self.assertIs(process_mathjax_script(dict(mathjax_settings)), mathjax_script)
+        self.assertEqual(process_mathjax_script.hits, hits + 1)
+
+        mathjax_settings["color"] = "blue"
+        self.assertIn("blue", process_mathjax_script(mathjax_settings))
+        self.assertEqual(process_mathjax_script.misses, misses + 1)
+
+        # Only the last rendered script is kept: the first settings render the
+        # template again
+        mathjax_settings["color"] = "inherit"
+        self.assertEqual(process_mathjax_script(mathjax_settings), mathjax_script)
+        self.assertEqual(process_mathjax_script.misses, misses + 2)
+
+    def test_fingerprint_ignores_build_settings(self):
+        mathjax_settings = process_settings(PelicanMock(get_settings(filenames={})))
+        fingerprint = settings_fingerprint(mathjax_settings)
+
+        for key, value in (
+            ("workers", 8),
+            ("loading", "lazy"),
+            ("lazy_margin", "50%"),
+            ("external_script", True),
+            ("profile", True),
+        ):
+            changed = dict(mathjax_settings, **{key: value})
+            self.assertEqual(settings_fingerprint(changed), fingerprint, key)
+
+        changed = dict(mathjax_settings, color="blue")
+        self.assertNotEqual(settings_fingerprint(changed), fingerprint)
+
+    def test_lazy_loading(self):
+        settings = get_settings(filenames={})
+        eager = process_mathjax_script(process_settings(PelicanMock(settings)))
+        self.assertIn("'eager' === 'lazy'", eager)
+
+        settings["MATH_JAX"] = {"loading": "lazy", "lazy_margin": "50%"}
+        lazy = process_mathjax_script(process_settings(PelicanMock(settings)))
+        self.assertIn("'lazy' === 'lazy'", lazy)
+        self.assertIn("rootMargin: '50%'", lazy)
+
+        settings["MATH_JAX"] = {"loading": "later"}
+        self.assertEqual(process_settings(PelicanMock(settings))["loading"], "eager")
+
+    @unittest.skipUnless(shutil.which("node"), "node is not installed")
+    def test_lazy_loading_typesets_once_mathjax_has_started(self):
+        settings = get_settings(filenames={})
+        settings["MATH_JAX"] = {"loading": "lazy"}
+        lazy = process_mathjax_script(process_settings(PelicanMock(settings)))
+
+        result = subprocess.run(
+            ["node", "-e", LAZY_LOADING_HARNESS, lazy],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(
+            json.loads(result.stdout),
+            {"appended": 2, "typeset": ["first", "second"]},
+        )
+
+    def test_process_summary_completes_truncated_math(self):
+        settings = get_settings(filenames={})
+        pelican_init(PelicanMock(settings))
+        article = ArticleMock(
+            '<p>Let <span class="math">\\(x &lt; 1\\)</span> and '
+            '<span class="math">\\(y = x^2 + 1\\)</span> hold.</p>',
+            summary='<p>Let <span class="math">\\(x &lt; 1\\)</span> and '
+            '<span class="math">\\(y = ...</span></p>',
+        )
+        index_math(article)
+        process_summary(article)
+        self.assertIn(
+            '<span class="math">\\(y = x^2 + 1\\) ...</span>',
+            article.summary,
+        )
+        self.assertIn("mathjaxscript_pelican", article.summary)
+
+    def test_process_summary_counts_math_like_the_content_index(self):
+        settings = get_settings(filenames={})
+        pelican_init(PelicanMock(settings))
+        content = (
+            '<p><span class="math rendered">x</span> and '
+            '<span class="math">\\(y = x^2 + 1\\)</span> hold.</p>'
+        )
+        for summary, expected in (
+            (
+                '<p><span class="math rendered">x</span> and '
+                '<span class="math">\\(y = ...</span></p>',
+                '<span class="math">\\(y = x^2 + 1\\) ...</span>',
+            ),
+            # More math in the summary than in the content is left as is
+            (
+                '<p><span class="math">\\(a\\)</span> '
+                '<span class="math">\\(y = ...</span></p>',
+                '<span class="math">\\(y = ...</span>',
+            ),
+        ):
+            article = ArticleMock(content, summary)
+            index_math(article)
+            process_summary(article)
+            self.assertIn(expected, article.summary)
+
 
 def _build_article_generator(settings, output_path):
     context = settings.copy()
@@ -59,3 +502,18 @@ class PelicanMock:
     def __init__(self, settings):
         self.plugins = []
         self.settings = settings
+
+
+class ArticleMock:
+    """Dummy article exposing the only attributes needed to process summaries."""
+
+    def __init__(self, content, summary):
+        self._content = content
+        self.metadata = {"summary": summary}
+
+    def get_summary(self, siteurl):
+        return self.metadata["summary"]
+
+    @property
+    def summary(self):
+        return self.get_summary("")
@@ -33,6 +33,29 @@ def tests(c, deprecations=False):
     c.run(f"{CMD_PREFIX}pytest {deprecations_flag}", pty=PTY)
 
 
+@task
+def benchmark(  # noqa: PLR0913
+    c,
+    articles=200,
+    paragraphs=20,
+    density=0.5,
+    formats="md,rst,ipynb",
+    workers=1,
+    repeat=3,
+    output=None,
+):
+    """Benchmark the plugin over a synthetic corpus, optionally saving `--output`."""
+    output_flag = f"--json {output}" if output else ""
+    c.run(
+        f"{CMD_PREFIX}python -m benchmarks.suite --articles {articles} "
+        f"--paragraphs {paragraphs} --density {density} --formats {formats} "
+        f"--workers {workers} --repeat {repeat} {output_flag}",
+        pty=PTY,
+        # build_support is shared with the site, next to the plugin
+        env={"PYTHONPATH": os.pardir},
+    )
+
+
 @task
 def format(c, check=False, diff=False):
     """Run Ruff's auto-formatter, optionally with `--check` or `--diff`."""
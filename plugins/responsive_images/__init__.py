@@ -0,0 +1,432 @@
+"""Responsive Images: resized and WebP copies of the images of the site.
+
+Every ``<img>`` of the content linking a local JPEG or PNG image with
+``{static}`` or ``{attach}`` is turned into a ``<picture>`` offering WebP
+copies of the image, along with copies in its own format, in each of the
+``RESPONSIVE_IMAGES_WIDTHS`` narrower than the image. Browsers then only
+download the size fitting the ``RESPONSIVE_IMAGES_SIZES`` of the layout, and
+the ``width`` and ``height`` of the image are set so the layout does not shift
+while it loads.
+
+Images are found in the content as it is read (``content_object_init``), so
+the output is never read back. The size of an image is read from its header,
+and the ``<picture>`` names the copies right away. The URLs of the copies are
+only completed when Pelican resolves the links of the content for a page. This
+is because the URL of the image then depends on the page (RELATIVE_URLS), and
+the copies are written next to the image.
+
+Copies are generated once all content is read. This happens in the build
+process, or in a pool of ``RESPONSIVE_IMAGES_WORKERS`` processes when that is
+raised. The copies are stored in Pelican's CACHE_PATH per hash of the image, so
+unchanged images are never processed again, and copies of images the build no
+longer uses are pruned. The stamp, hash and size of every image are kept too,
+so unchanged images are not even read. The filenames of the copies carry the
+hash, so browsers never use stale copies.
+
+Generating copies requires Pillow. Without it, images are left as they are.
+"""
+
+import functools
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import shutil
+from urllib.parse import unquote, urlparse
+
+from build_support.cache import PruningCache
+from build_support.pool import process_map
+from build_support.store import ContentStore
+
+from pelican import signals
+from pelican.contents import Static
+
+try:
+    from PIL import ExifTags, Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (480, 800, 1200, 1600)
+
+# Format and extension of the copies of the images in their own format, by
+# extension of the images for which copies are generated
+FORMATS = {
+    ".jpg": ("JPEG", ".jpg"),
+    ".jpeg": ("JPEG", ".jpg"),
+    ".png": ("PNG", ".png"),
+}
+
+# EXIF orientations of the images which are rotated by a quarter turn
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Stands for the URL of the directory of the image in the srcset of its
+# <picture>, until the links of the content are resolved for a page
+COPIES_URL = "{responsive_images}"
+
+IMG_RE = re.compile(r"<img\b(?P<attributes>[^>]*?)\s*/?>", re.IGNORECASE)
+ATTRIBUTE_RE = re.compile(
+    r"""(?P<name>[\w-]+)\s*=\s*(?:"(?P<double>[^"]*)"|'(?P<single>[^']*)')"""
+)
+PICTURE_RE = re.compile(r"<picture>.*?</picture>", re.DOTALL)
+
+
+def image_key(digest, widths, quality):
+    """Hash the image along with the settings the copies are generated with."""
+    key = hashlib.sha256(json.dumps([list(widths), quality]).encode("utf-8"))
+    key.update(digest.encode("ascii"))
+    return key.hexdigest()
+
+
+def stamp(filename):
+    """Return the size and modification time of the file, or None if it is missing."""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def image_size(filename):
+    """Return the width and height of the image, as browsers show it.
+
+    Only the header of the image is read. Browsers apply the EXIF orientation,
+    so do the copies.
+    """
+    with Image.open(filename) as image:
+        width, height = image.size
+        orientation = image.getexif().get(ExifTags.Base.Orientation)
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def generate_copies(job):
+    """Generate the copies of an image into its directory of the store.
+
+    The metadata of the image is written last, so that copies are only used
+    once they are all there.
+    """
+    filename, directory, widths, quality = job
+    image_format, extension = FORMATS[os.path.splitext(filename)[1].lower()]
+    os.makedirs(directory, exist_ok=True)
+
+    with Image.open(filename) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+        width, height = image.size
+        copy_widths = [w for w in widths if w < width]
+
+        for copy_width in [*copy_widths, width]:
+            copy_height = round(height * copy_width / width)
+            resized = image.resize((copy_width, copy_height), Image.Resampling.LANCZOS)
+            resized.save(
+                os.path.join(directory, f"{copy_width}.webp"),
+                "WEBP",
+                quality=quality,
+            )
+            if copy_width == width:
+                continue
+            if image_format == "JPEG":
+                resized.convert("RGB").save(
+                    os.path.join(directory, f"{copy_width}{extension}"),
+                    "JPEG",
+                    quality=quality,
+                    optimize=True,
+                    progressive=True,
+                )
+            else:
+                resized.save(
+                    os.path.join(directory, f"{copy_width}{extension}"),
+                    "PNG",
+                    optimize=True,
+                )
+
+    metadata = {"width": width, "height": height, "widths": copy_widths}
+    with open(os.path.join(directory, "metadata.json"), "w") as metadata_file:
+        json.dump(metadata, metadata_file)
+
+
+def copy_name(filename, key, width, extension):
+    """Return the filename of a copy of the image."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return f"{stem}-{key[:8]}-{width}w{extension}"
+
+
+def copies(filename, metadata):
+    """Return the (width, extension) of the copies of the image."""
+    extension = FORMATS[os.path.splitext(filename)[1].lower()][1]
+    return [
+        *((width, ".webp") for width in [*metadata["widths"], metadata["width"]]),
+        *((width, extension) for width in metadata["widths"]),
+    ]
+
+
+def parse_attributes(text):
+    """Return the attributes of a tag, unescaped, in order."""
+    return {
+        match.group("name").lower(): html.unescape(
+            match.group("double")
+            if match.group("double") is not None
+            else match.group("single")
+        )
+        for match in ATTRIBUTE_RE.finditer(text)
+    }
+
+
+def format_attributes(attributes):
+    """Return the attributes, escaped, as they go in a tag."""
+    return "".join(
+        f' {name}="{html.escape(value)}"' for name, value in attributes.items()
+    )
+
+
+def picture(attributes, image, sizes):
+    """Return the <picture> replacing an <img>, given the copies of its image.
+
+    The URLs of the copies start with COPIES_URL, which `resolve_copy_urls`
+    replaces.
+    """
+    filename, key, metadata = image
+    extension = FORMATS[os.path.splitext(filename)[1].lower()][1]
+
+    def candidates(widths, copy_extension):
+        return ", ".join(
+            f"{COPIES_URL}{copy_name(filename, key, width, copy_extension)} {width}w"
+            for width in widths
+        )
+
+    webp = candidates([*metadata["widths"], metadata["width"]], ".webp")
+    own_format = candidates(metadata["widths"], extension)
+    own_format += (", " if own_format else "") + (
+        f"{COPIES_URL}{os.path.basename(filename)} {metadata['width']}w"
+    )
+
+    attributes = dict(attributes, srcset=own_format, sizes=sizes)
+    if "width" not in attributes and "height" not in attributes:
+        attributes["width"] = str(metadata["width"])
+        attributes["height"] = str(metadata["height"])
+        # The size only gives the aspect ratio when the image is scaled, e.g.
+        # by a width set in its style
+        style = attributes.get("style", "").strip().rstrip(";")
+        attributes["style"] = f"{style}; height: auto;" if style else "height: auto;"
+
+    return (
+        "<picture>"
+        f'<source type="image/webp" srcset="{html.escape(webp)}" '
+        f'sizes="{html.escape(sizes)}">'
+        f"<img{format_attributes(attributes)}>"
+        "</picture>"
+    )
+
+
+def resolve_copy_urls(update_content, text, siteurl):
+    """Resolve the links of the content, then the URLs of the copies of its images.
+
+    Copies are next to their image in the output, so their URLs are in the
+    directory of the URL of the image, once resolved for the page.
+    """
+    text = update_content(text, siteurl)
+    if COPIES_URL not in text:
+        return text
+
+    def resolve(match):
+        img = IMG_RE.search(match.group(0))
+        src = parse_attributes(img.group("attributes")).get("src", "")
+        directory_url = src.rsplit("/", 1)[0] + "/" if "/" in src else ""
+        return match.group(0).replace(COPIES_URL, html.escape(directory_url))
+
+    return PICTURE_RE.sub(resolve, text)
+
+
+class ImageIndex(PruningCache):
+    """Stamp, hash and size of the images, per path in the content."""
+
+    def __init__(self, settings):
+        super().__init__(settings, "responsive_images_index", True, True)
+
+
+class ImageCopies:
+    """The images of the content of a build, and their copies."""
+
+    def __init__(self, settings):
+        self.content_path = settings["PATH"]
+        self.widths = tuple(
+            sorted(settings.get("RESPONSIVE_IMAGES_WIDTHS", DEFAULT_WIDTHS))
+        )
+        self.sizes = settings.get("RESPONSIVE_IMAGES_SIZES", "100vw")
+        self.quality = settings.get("RESPONSIVE_IMAGES_QUALITY", 80)
+        self.workers = max(1, settings.get("RESPONSIVE_IMAGES_WORKERS", 1))
+        self.index = ImageIndex(settings)
+        self.store = ContentStore(
+            os.path.join(settings.get("CACHE_PATH", "cache"), "responsive_images")
+        )
+        self.intrasite_link_re = re.compile(
+            settings["INTRASITE_LINK_REGEX"] + r"(?P<value>.*)"
+        )
+        # (filename, key, metadata) of every image, by path in the content
+        self.images = {}
+        self.static_content = {}
+        self.generated = 0
+
+    def linked_image(self, content, src):
+        """Return the path in the content of the image linked, if it is one."""
+        match = self.intrasite_link_re.fullmatch(src)
+        if match is None or match.group("what") not in ("static", "attach"):
+            return None
+        # Found like Pelican finds linked static files
+        path = unquote(urlparse(match.group("value")).path)
+        if path.startswith("/"):
+            path = path[1:]
+        else:
+            path = content.get_relative_source_path(
+                os.path.join(content.relative_dir, path)
+            )
+        if os.path.splitext(path)[1].lower() not in FORMATS:
+            return None
+        return path
+
+    def image(self, path):
+        """Return the file, key and metadata of the image, or None if it is not one."""
+        if path in self.images:
+            return self.images[path]
+
+        filename = os.path.join(self.content_path, path)
+        file_stamp = stamp(filename)
+        cached = self.index.get(path)
+        if file_stamp is None:
+            image = None
+        elif cached is not None and cached[0] == file_stamp:
+            _, digest, (width, height) = cached
+            image = filename, digest, width, height
+        else:
+            try:
+                with open(filename, "rb") as image_file:
+                    digest = hashlib.sha256(image_file.read()).hexdigest()
+                width, height = image_size(filename)
+            except OSError as e:
+                logger.warning("responsive_images: cannot read %s: %s", path, e)
+                image = None
+            else:
+                self.index.put(path, (file_stamp, digest, (width, height)))
+                image = filename, digest, width, height
+
+        if image is not None:
+            filename, digest, width, height = image
+            metadata = {
+                "width": width,
+                "height": height,
+                "widths": [w for w in self.widths if w < width],
+            }
+            image = filename, image_key(digest, self.widths, self.quality), metadata
+        self.images[path] = image
+        return image
+
+    def offer(self, content):
+        """Turn the <img> of local images of the content into <picture>."""
+
+        def replace(match):
+            attributes = parse_attributes(match.group("attributes"))
+            if "src" not in attributes or "srcset" in attributes:
+                return match.group(0)
+            path = self.linked_image(content, attributes["src"])
+            image = self.image(path) if path is not None else None
+            if image is None:
+                return match.group(0)
+            return picture(attributes, image, self.sizes)
+
+        text = IMG_RE.sub(replace, content._content)
+        if text != content._content:
+            content._content = text
+            content._update_content = functools.partial(
+                resolve_copy_urls, content._update_content
+            )
+
+    def generate(self):
+        """Generate the copies of the images which are not in the store."""
+        jobs = []
+        for filename, key, _ in filter(None, self.images.values()):
+            directory = self.store.filename(key)
+            if not os.path.exists(os.path.join(directory, "metadata.json")):
+                jobs.append((filename, directory, self.widths, self.quality))
+        process_map(generate_copies, jobs, self.workers if len(jobs) > 1 else 1)
+        self.generated = len(jobs)
+
+    def write(self, output_path):
+        """Copy the copies next to their image in the output, and prune the store."""
+        for path, image in self.images.items():
+            static = self.static_content.get(path)
+            if image is None or static is None:
+                continue
+            filename, key, metadata = image
+            directory = self.store.filename(key)
+            output_directory = os.path.dirname(
+                os.path.join(output_path, static.save_as)
+            )
+            for width, extension in copies(filename, metadata):
+                target = os.path.join(
+                    output_directory, copy_name(filename, key, width, extension)
+                )
+                if not os.path.exists(target):
+                    shutil.copyfile(
+                        os.path.join(directory, f"{width}{extension}"), target
+                    )
+
+        pruned = self.store.prune()
+        self.index.save_cache()
+        images = sum(1 for image in self.images.values() if image is not None)
+        logger.info(
+            "responsive_images: %d images, %d processed, %d from cache, "
+            "%d unused pruned",
+            images,
+            self.generated,
+            images - self.generated,
+            pruned,
+        )
+
+
+def offer_copies(content):
+    """Offer copies of the images of content being read."""
+    if Image is None or isinstance(content, Static) or not content._content:
+        return
+    if offer_copies.images is None:
+        offer_copies.images = ImageCopies(content.settings)
+    offer_copies.images.offer(content)
+
+
+offer_copies.images = None
+
+
+def generate_image_copies(generators):
+    """Generate the copies of the images, once all content is read."""
+    images = offer_copies.images
+    if images is None:
+        return
+    images.static_content = generators[0].context["static_content"]
+    images.generate()
+
+
+def write_image_copies(pelicanobj):
+    """Write the copies of the images to the output, once the site is written."""
+    images = offer_copies.images
+    offer_copies.images = None
+    if images is not None:
+        images.write(pelicanobj.output_path)
+
+
+def warn_without_pillow(pelicanobj):
+    """Report that images are left as they are, if Pillow is missing."""
+    if Image is None:
+        logger.warning("responsive_images: Pillow is not installed, images are kept")
+
+
+def register():
+    """Register the plugin."""
+    signals.initialized.connect(warn_without_pillow)
+    signals.content_object_init.connect(offer_copies)
+    signals.all_generators_finalized.connect(generate_image_copies)
+    signals.finalized.connect(write_image_copies)
@@ -0,0 +1,105 @@
+import os
+from os.path import exists, join
+import re
+import sys
+from tempfile import TemporaryDirectory
+
+from pelican import Pelican, signals
+from pelican.settings import read_settings
+from pelican.tests.support import unittest
+
+from . import generate_image_copies, offer_copies, write_image_copies
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ARTICLE = """Title: Photo
+Date: 2020-01-01
+
+![A photo]({static}/images/photo.jpg) and ![a logo]({static}/images/logo.png)
+"""
+
+SRCSET_RE = re.compile(r'srcset="([^"]*)"')
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class ResponsiveImagesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.content_path = join(self.tmpdir.name, "content")
+        self.output_path = join(self.tmpdir.name, "output")
+        os.makedirs(join(self.content_path, "images"))
+        Image.new("RGB", (1000, 500), "red").save(
+            join(self.content_path, "images", "photo.jpg")
+        )
+        Image.new("RGB", (400, 400), "blue").save(
+            join(self.content_path, "images", "logo.png")
+        )
+        self.write_article(ARTICLE)
+
+    def tearDown(self):
+        signals.content_object_init.disconnect(offer_copies)
+        signals.all_generators_finalized.disconnect(generate_image_copies)
+        signals.finalized.disconnect(write_image_copies)
+        self.tmpdir.cleanup()
+
+    def write_article(self, text):
+        with open(join(self.content_path, "photo.md"), "w") as article:
+            article.write(text)
+
+    def build(self):
+        """Build the site with relative URLs, and return the copies in the store."""
+        settings = read_settings(
+            override={
+                "PATH": self.content_path,
+                "OUTPUT_PATH": self.output_path,
+                "CACHE_PATH": join(self.tmpdir.name, "cache"),
+                "PLUGINS": [sys.modules[__package__]],
+                "RELATIVE_URLS": True,
+                "ARTICLE_URL": "posts/{slug}/",
+                "ARTICLE_SAVE_AS": "posts/{slug}/index.html",
+                "RESPONSIVE_IMAGES_WIDTHS": [480, 800],
+                "FEED_ALL_ATOM": None,
+            }
+        )
+        Pelican(settings).run()
+        store = join(self.tmpdir.name, "cache", "responsive_images")
+        return sorted(
+            os.path.relpath(join(path, name), store)
+            for path, _, names in os.walk(store)
+            for name in names
+        )
+
+    def srcsets(self, page):
+        """Return the files of the candidates of the page, relative to the page."""
+        with open(join(self.output_path, page)) as page_file:
+            text = page_file.read()
+        return [
+            os.path.normpath(join(os.path.dirname(page), candidate.split()[0]))
+            for srcset in SRCSET_RE.findall(text)
+            for candidate in srcset.split(", ")
+        ]
+
+    def test_copies_are_offered_relative_to_each_page(self):
+        self.build()
+
+        article = self.srcsets(join("posts", "photo", "index.html"))
+        self.assertEqual(len([f for f in article if f.endswith(".webp")]), 4)
+        self.assertIn(join("images", "photo.jpg"), article)
+        self.assertIn(join("images", "logo.png"), article)
+        # The index shows the image from another directory
+        self.assertEqual(self.srcsets("index.html"), article)
+        for filename in article:
+            self.assertTrue(exists(join(self.output_path, filename)), filename)
+
+    def test_unused_copies_are_pruned(self):
+        stored = self.build()
+        self.assertEqual(self.build(), stored)
+
+        self.write_article(ARTICLE.split(" and ")[0] + "\n")
+        remaining = self.build()
+        self.assertTrue(remaining)
+        self.assertLess(len(remaining), len(stored))
+        self.assertTrue(set(remaining) < set(stored))
@@ -0,0 +1,278 @@
+"""Typogrify Cache: cached and parallel Typogrify pass over the site's content.
+
+With ``TYPOGRIFY = True``, Pelican runs every body, title and summary through
+Typogrify's filters while reading it, one after the other, on every build. This
+plugin takes over from Pelican:
+
+* titles and summaries are still typogrified while they are read, before the
+  slug is derived from the title, so URLs do not change;
+* bodies are typogrified once all content is read, in the build process, or
+  spread over ``TYPOGRIFY_WORKERS`` processes if more than one is configured.
+
+Every typogrified text is kept in a cache keyed on the hash of the text and of
+the Typogrify settings, in Pelican's CACHE_PATH, so unchanged text is never
+typogrified twice across builds. The cache follows the CACHE_CONTENT and
+LOAD_CONTENT_CACHE settings, like Pelican's own content cache. At the end of
+the pass, the time saved by the cache is logged.
+
+Pelican typogrifies bodies as it reads them, before the content objects are
+created. With this plugin, bodies are only typogrified on
+``all_generators_finalized``: handlers of ``content_object_init`` and of the
+generators' ``*_finalized`` signals see bodies as the readers output them, and
+only handlers of ``all_generators_finalized`` connected after this plugin see
+them typogrified. The plugin must therefore be listed before ``render_math`` in
+PLUGINS, so that bodies are typogrified before the math in them is processed,
+as Pelican would do.
+
+``TYPOGRIFY`` is turned off while the content is read, so that the readers
+leave the text to the plugin, and turned back on once the bodies are
+typogrified.
+"""
+
+import hashlib
+import logging
+import time
+
+from build_support.cache import PruningCache
+from build_support.pool import process_map
+
+from pelican import signals
+
+logger = logging.getLogger(__name__)
+
+# Attributes of the generators holding the content read
+CONTENT_ATTRIBUTES = (
+    "articles",
+    "translations",
+    "hidden_articles",
+    "hidden_translations",
+    "drafts",
+    "drafts_translations",
+    "pages",
+    "hidden_pages",
+    "draft_pages",
+    "draft_translations",
+)
+
+
+def typogrify_options(settings):
+    """Return the Typogrify settings, in a picklable and hashable form."""
+    return (
+        tuple(settings["TYPOGRIFY_IGNORE_TAGS"]),
+        tuple(settings["TYPOGRIFY_OMIT_FILTERS"]),
+        settings["TYPOGRIFY_DASHES"],
+    )
+
+
+def typogrify_text(text, options):
+    """Typogrify the text like Pelican's readers do."""
+    import smartypants  # noqa: PLC0415
+    from typogrify.filters import typogrify  # noqa: PLC0415
+
+    ignore_tags, omit_filters, dashes = options
+    if dashes == "oldschool":
+        smartypants.Attr.default = smartypants.Attr.set2
+    elif dashes == "oldschool_inverted":
+        smartypants.Attr.default = smartypants.Attr.set3
+    else:
+        smartypants.Attr.default = smartypants.Attr.set1
+    # Also replace the &quot; entities output by docutils with smart quotes
+    smartypants.Attr.default |= smartypants.Attr.w
+
+    # Older versions of Typogrify do not support all the settings
+    try:
+        return typogrify(text, list(ignore_tags), **dict.fromkeys(omit_filters, False))
+    except TypeError:
+        try:
+            return typogrify(text, list(ignore_tags))
+        except TypeError:
+            return typogrify(text)
+
+
+def timed_typogrify(text):
+    """Typogrify the text with the options of the build, and time it."""
+    start = time.perf_counter()
+    typogrified = typogrify_text(text, timed_typogrify.options)
+    return typogrified, time.perf_counter() - start
+
+
+timed_typogrify.options = None
+
+
+def set_worker_options(options):
+    """Set the Typogrify settings in a worker process."""
+    timed_typogrify.options = options
+
+
+class TypogrifyCache(PruningCache):
+    """Cache of typogrified text, with the time it took, per hash of the text."""
+
+    def __init__(self, settings, options):
+        super().__init__(
+            settings,
+            "typogrify",
+            settings.get("CACHE_CONTENT", False),
+            settings.get("LOAD_CONTENT_CACHE", False),
+        )
+        self.options_fingerprint = repr(options).encode("utf-8")
+
+    def key(self, text):
+        digest = hashlib.sha256(self.options_fingerprint)
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, text):
+        """Return the cached (typogrified text, seconds) of the text, if any."""
+        return super().get(self.key(text))
+
+    def put(self, text, typogrified, seconds):
+        super().put(self.key(text), (typogrified, seconds))
+
+
+def typogrify_cached(text):
+    """Typogrify the text, going through the cache, and record the statistics."""
+    stats = typogrify_contents.stats
+    cached = typogrify_contents.cache.get(text)
+    if cached is not None:
+        stats["hits"] += 1
+        stats["saved"] += cached[1]
+        return cached[0]
+
+    typogrified, seconds = timed_typogrify(text)
+    typogrify_contents.cache.put(text, typogrified, seconds)
+    stats["misses"] += 1
+    stats["seconds"] += seconds
+    stats["filtering"] += seconds
+    return typogrified
+
+
+def init_typogrify_cache(pelicanobj):
+    """Take note of whether Typogrify is enabled, and of the number of workers."""
+    settings = pelicanobj.settings
+    take_over_typogrify.enabled = settings.get("TYPOGRIFY", False)
+    typogrify_contents.workers = max(1, settings.get("TYPOGRIFY_WORKERS", 1))
+
+
+def take_over_typogrify(readers):
+    """Disable Pelican's own Typogrify pass, and set up the cache for the build.
+
+    This is done when the readers are created rather than on initialization, so
+    that other plugins (e.g. render_math) have adjusted the Typogrify settings.
+    """
+    if not take_over_typogrify.enabled:
+        return
+
+    try:
+        import typogrify.filters  # noqa: F401, PLC0415
+    except ImportError:
+        # Leave Typogrify to Pelican, which reports it is missing
+        return
+
+    readers.settings["TYPOGRIFY"] = False
+    typogrify_contents.settings = readers.settings
+    if typogrify_contents.cache is None:
+        options = typogrify_options(readers.settings)
+        timed_typogrify.options = options
+        typogrify_contents.cache = TypogrifyCache(readers.settings, options)
+        typogrify_contents.stats = {
+            "hits": 0,
+            "misses": 0,
+            "saved": 0.0,
+            "seconds": 0.0,
+            "filtering": 0.0,
+        }
+
+
+take_over_typogrify.enabled = False
+
+
+def typogrify_metadata(generator, metadata):
+    """Typogrify the title and summary of content being read."""
+    if typogrify_contents.cache is None:
+        return
+
+    for key in ("title", "summary"):
+        if key in metadata:
+            metadata[key] = typogrify_cached(metadata[key])
+
+
+def typogrify_contents(content_generators):
+    """Typogrify the body of all content, optionally over a pool of processes.
+
+    Bodies found in the cache are restored from it, the others are typogrified,
+    then the cache is saved and the savings are logged.
+    """
+    cache = typogrify_contents.cache
+    if cache is None:
+        return
+
+    contents = {}
+    for generator in content_generators:
+        for attribute in CONTENT_ATTRIBUTES:
+            for content in getattr(generator, attribute, ()):
+                if content._content:
+                    contents[id(content)] = content
+
+    stats = typogrify_contents.stats
+    missing = []
+    for content in contents.values():
+        cached = cache.get(content._content)
+        if cached is None:
+            missing.append(content._content)
+        else:
+            stats["hits"] += 1
+            stats["saved"] += cached[1]
+    # Identical bodies are only typogrified once
+    missing = list(dict.fromkeys(missing))
+
+    start = time.perf_counter()
+    workers = typogrify_contents.workers
+    results = process_map(
+        timed_typogrify,
+        missing,
+        workers if len(missing) > 1 else 1,
+        initializer=set_worker_options,
+        initargs=(timed_typogrify.options,),
+    )
+    stats["seconds"] += time.perf_counter() - start
+
+    for text, (typogrified, seconds) in zip(missing, results):
+        cache.put(text, typogrified, seconds)
+        stats["misses"] += 1
+        stats["filtering"] += seconds
+
+    for content in contents.values():
+        content._content = cache.get(content._content)[0]
+
+    cache.save_cache()
+    typogrify_contents.cache = None
+    typogrify_contents.settings["TYPOGRIFY"] = True
+    typogrify_contents.settings = None
+
+    logger.info(
+        "typogrify_cache: %d of %d texts restored from cache, saving %.2f s; "
+        "%d typogrified in %.2f s (%.2f s of filtering, %d workers)",
+        stats["hits"],
+        stats["hits"] + stats["misses"],
+        stats["saved"],
+        stats["misses"],
+        stats["seconds"],
+        stats["filtering"],
+        workers,
+    )
+
+
+typogrify_contents.cache = None
+typogrify_contents.settings = None
+typogrify_contents.stats = None
+typogrify_contents.workers = 1
+
+
+def register():
+    """Register the plugin."""
+    signals.initialized.connect(init_typogrify_cache)
+    signals.readers_init.connect(take_over_typogrify)
+    signals.article_generator_context.connect(typogrify_metadata)
+    signals.page_generator_context.connect(typogrify_metadata)
+    signals.all_generators_finalized.connect(typogrify_contents)
@@ -0,0 +1,110 @@
+import os
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from pelican import signals
+from pelican.generators import ArticlesGenerator
+from pelican.tests.support import get_settings, unittest
+
+from . import (
+    init_typogrify_cache,
+    take_over_typogrify,
+    typogrify_contents,
+    typogrify_metadata,
+)
+
+try:
+    import typogrify.filters
+except ImportError:
+    typogrify = None
+
+ARTICLES = {
+    "quotes.md": (
+        'Title: "Quotes" -- and... dashes\n'
+        "Date: 2020-01-01\n"
+        'Summary: It\'s a <em>summary</em> -- "quoted"...\n'
+        "\n"
+        'Some "quoted" text -- with dashes... and `"code"`.\n'
+        "\n"
+        '    <pre>"kept" -- as is</pre>\n'
+    ),
+    "quotes.rst": (
+        'Don\'t "stop"\n'
+        "############\n"
+        "\n"
+        ":date: 2020-01-02\n"
+        "\n"
+        'A "body" -- in reStructuredText... 1/2 of it.\n'
+    ),
+}
+
+
+class PelicanMock:
+    """Dummy class exposing the only attributes needed."""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+
+def build_articles(settings, output_path, plugin):
+    """Read the articles, with the plugin or with Pelican's own Typogrify pass."""
+    if plugin:
+        init_typogrify_cache(PelicanMock(settings))
+    context = settings.copy()
+    context["generated_content"] = {}
+    context["static_links"] = set()
+    generator = ArticlesGenerator(
+        context=context,
+        settings=settings,
+        path=settings["PATH"],
+        theme=settings["THEME"],
+        output_path=output_path,
+    )
+    generator.generate_context()
+    if plugin:
+        typogrify_contents([generator])
+    return sorted(
+        (article.slug, article.title, article.summary, article.content)
+        for article in generator.articles
+    )
+
+
+@unittest.skipIf(typogrify is None, "typogrify is not installed")
+class TypogrifyCacheTest(unittest.TestCase):
+    def setUp(self):
+        signals.readers_init.connect(take_over_typogrify)
+        signals.article_generator_context.connect(typogrify_metadata)
+
+    def tearDown(self):
+        signals.readers_init.disconnect(take_over_typogrify)
+        signals.article_generator_context.disconnect(typogrify_metadata)
+        take_over_typogrify.enabled = False
+
+    def test_output_is_identical_to_pelican(self):
+        with TemporaryDirectory() as tmpdirname:
+            content_path = join(tmpdirname, "content")
+            os.makedirs(content_path)
+            for name, text in ARTICLES.items():
+                with open(join(content_path, name), "w") as article:
+                    article.write(text)
+
+            def settings(**overrides):
+                settings = get_settings(filenames={})
+                settings["PATH"] = content_path
+                settings["CACHE_PATH"] = join(tmpdirname, "cache")
+                settings["TYPOGRIFY"] = True
+                settings.update(overrides)
+                return settings
+
+            expected = build_articles(settings(), tmpdirname, plugin=False)
+            self.assertIn("&#8212;", expected[0][1] + expected[1][1])
+
+            # Once typogrified, then restored from the cache
+            for _ in range(2):
+                plugin_settings = settings(CACHE_CONTENT=True, LOAD_CONTENT_CACHE=True)
+                result = build_articles(plugin_settings, tmpdirname, plugin=True)
+                self.assertEqual(result, expected)
+                # Turned off for the readers only
+                self.assertTrue(plugin_settings["TYPOGRIFY"])
+
+            self.assertEqual(typogrify_contents.stats["misses"], 0)
@@ -9,3 +9,11 @@ FEED_ALL_ATOM = 'feeds/all.atom.xml'
 CATEGORY_FEED_ATOM = 'feeds/{slug}.atom.xml'
 
 DELETE_OUTPUT_DIRECTORY = True
+
+# Write .gz and .br copies of the output for the web server to send
+PLUGINS = PLUGINS + ["precompress"]
+
+# Spread the build passes of the local plugins over all cores
+TYPOGRIFY_WORKERS = os.cpu_count()
+PRECOMPRESS_WORKERS = os.cpu_count()
+RESPONSIVE_IMAGES_WORKERS = os.cpu_count()